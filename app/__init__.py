@@ -1,13 +1,21 @@
-from flask import Flask, jsonify, request
+import click
+from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_cors import CORS
 from flask_jwt_extended import JWTManager, get_jwt_identity, verify_jwt_in_request
 from config import config
+from app.cache import TTLCache, create_cache, generation_lookup, user_cache_name
+from app.compression import init_compression
+from app.cors import init_cors
+from app.engine import (
+    RoutingSession, configure_engine_options, create_replica_engines, set_sqlite_pragmas
+)
+from app.hashing import create_password_hasher
+from app.json_provider import get_json_provider_class
+from app.metrics import init_metrics
+from app.profiling import init_profiling
 
 # Initialize extensions
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 jwt = JWTManager()
 
 # Create the application factory
@@ -15,42 +23,89 @@ def create_app(config_name='default'):
     """Create and configure the Flask application"""
     app = Flask(__name__)
     
-    # Load configuration
-    app.config.from_object(config[config_name])
-    config[config_name].init_app(app)
+    # Load configuration; a mapping is applied on top of the testing config
+    if isinstance(config_name, dict):
+        app.config.from_object(config['testing'])
+        app.config.from_mapping(config_name)
+        config['testing'].init_app(app)
+    else:
+        app.config.from_object(config[config_name])
+        config[config_name].init_app(app)
+    
+    # Serialize JSON with the configured provider
+    app.json = get_json_provider_class(app.config['JSON_PROVIDER'])(app)
     
     # Initialize extensions
+    configure_engine_options(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    with app.app_context():
+        for engine in db.engines.values():
+            set_sqlite_pragmas(engine, app.config['SQLITE_PRAGMAS'])
+    
+    # Optional read replicas for GET traffic
+    create_replica_engines(app)
     
     # Initialize JWT
     jwt.init_app(app)
     
-    # Configure CORS
-    CORS(
-        app,
-        resources={
-            r"/api/*": {
-                "origins": app.config.get('CORS_ORIGINS', []),
-                "supports_credentials": True,
-                "allow_headers": ["Content-Type", "Authorization", "X-CSRF-TOKEN"],
-                "expose_headers": ["X-CSRF-TOKEN"],
-                "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
-            }
-        },
-        supports_credentials=True
-    )
+    # Short-lived cache of book listing totals, keyed by search terms
+    app.extensions['book_totals'] = TTLCache(
+        ttl=app.config['BOOK_TOTALS_CACHE_TTL'])
+    
+    # Snapshots of authenticated users, so tokens don't cost a query each
+    app.extensions['user_cache'] = create_cache(
+        ttl=app.config['USER_CACHE_TTL'],
+        maxsize=app.config['USER_CACHE_MAX_ENTRIES'],
+        redis_url=app.config['USER_CACHE_REDIS_URL'],
+        prefix='user-cache:')
+    
+    # Password hashing runs in worker processes, off the request threads
+    app.extensions['password_hasher'] = create_password_hasher(app.config)
+    
+    # Read-through cache of serialized single-book payloads
+    app.extensions['book_cache'] = create_cache(
+        ttl=app.config['BOOK_CACHE_TTL'],
+        maxsize=app.config['BOOK_CACHE_MAX_ENTRIES'],
+        redis_url=app.config['BOOK_CACHE_REDIS_URL'])
+    
+    # Per-endpoint latency and query counts, measured around every other hook
+    init_metrics(app)
+    
+    # Flag N+1 and slow queries in development and tests
+    init_profiling(app)
+    
+    # Compress large responses for clients that accept it
+    init_compression(app)
+    
+    # CORS headers for the API; preflights are answered before routing
+    init_cors(app)
     
     # JWT configuration
     @jwt.user_identity_loader
     def user_identity_lookup(user):
-        return user['id']
+        return user['id'] if isinstance(user, dict) else user
+    
+    @jwt.additional_claims_loader
+    def add_claims_to_access_token(user):
+        # Carry what most requests need in the token itself
+        if isinstance(user, dict):
+            return {'email': user['email'], 'is_admin': user['is_admin']}
+        return {}
     
     @jwt.user_lookup_loader
     def user_lookup_callback(_jwt_header, jwt_data):
         from app.models import User
         identity = jwt_data["sub"]
-        return User.query.get(identity)
+        key, entry = generation_lookup(app.extensions['user_cache'], user_cache_name(identity))
+        if entry is not None:
+            return app.json.loads(entry)
+        found = db.session.get(User, identity)
+        if found is None:
+            return None
+        user = found.to_dict()
+        if key is not None:
+            app.extensions['user_cache'].set(key, app.json.dumps(user))
+        return user
     
     # JWT error handlers
     @jwt.unauthorized_loader
@@ -84,21 +139,22 @@ def create_app(config_name='default'):
     app.register_blueprint(library_routes.bp, url_prefix='/api/library')
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
-    
-    # Add CORS headers to all responses
-    @app.after_request
-    def after_request(response):
-        # Add CORS headers
-        response.headers.add('Access-Control-Allow-Origin', 
-                           request.headers.get('Origin', '*'))
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-        response.headers.add('Access-Control-Allow-Headers',
-                           'Content-Type,Authorization,X-CSRF-TOKEN')
-        response.headers.add('Access-Control-Allow-Methods',
-                           'GET,PUT,POST,DELETE,OPTIONS')
-        return response
+    # create-tables, seed and (Flask-Migrate's) db commands
+    from app.cli import init_cli
+    init_cli(app)
+    
+    # Opt-in background sweeps of overdue checkouts; never for `flask`
+    # commands, which build the app too
+    if app.config['OVERDUE_SWEEP_INTERVAL'] > 0 and click.get_current_context(silent=True) is None:
+        from app.library.overdue import OverdueSweeper
+        app.extensions['overdue_sweeper'] = OverdueSweeper(
+            app, app.config['OVERDUE_SWEEP_INTERVAL']).start()
+    
+    # Outside fast-start mode, create missing tables; otherwise building the
+    # app does no database I/O and the schema comes from `flask db upgrade`
+    # or `flask create-tables`
+    if app.config['CREATE_TABLES_ON_STARTUP']:
+        with app.app_context():
+            db.create_all()
     
     return app
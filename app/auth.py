@@ -1,5 +1,6 @@
-from flask import Blueprint, request, jsonify, current_app
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, request, jsonify, current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 import jwt
 import datetime
 from functools import wraps
@@ -8,23 +9,58 @@ from flask_jwt_extended import (
     jwt_required, 
     get_jwt_identity,
     verify_jwt_in_request,
-    get_jwt
+    get_jwt,
+    get_current_user as get_jwt_user
 )
 
 # Import db from the main app package to avoid circular imports
 from app import db
 from app.models import User
+from app.cache import user_cache_name
+from app.hashing import HasherBusy, get_password_hasher
 
 # Create auth blueprint
 auth_bp = Blueprint('auth', __name__)
 
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def mark_cached_user_stale(mapper, connection, target):
+    """Note users whose profile or admin flag changed, to uncache on commit"""
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('stale_users', set()).add(target.id)
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_cached_users(session):
+    """Retire the cached snapshots of users changed by the commit, in every
+    worker sharing the cache"""
+    stale = session.info.pop('stale_users', None)
+    if stale and has_app_context():
+        current_app.extensions['user_cache'].delete(*(user_cache_name(i) for i in stale))
+
+@event.listens_for(Session, 'after_rollback')
+def forget_stale_users(session):
+    session.info.pop('stale_users', None)
+
+def hashing_busy():
+    """503 for when the password hashing queue is full"""
+    response = jsonify({
+        'message': 'Too many sign-ins in progress, please retry shortly',
+        'error': 'hashing_busy'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(current_app.config['PASSWORD_HASH_RETRY_AFTER'])
+    return response
+
 def admin_required():
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
             verify_jwt_in_request()
-            claims = get_jwt()
-            if claims["is_admin"]:
+            # The loaded (or cached) user, not the token's claim, which
+            # stays as it was for the token's whole lifetime
+            user = get_jwt_user()
+            if user and user["is_admin"]:
                 return fn(*args, **kwargs)
             return jsonify({"message": "Admins only!"}), 403
         return decorator
@@ -32,6 +68,10 @@ def admin_required():
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
+    # Turn the request away before doing any work if it couldn't be hashed
+    if get_password_hasher().busy():
+        return hashing_busy()
+    
     data = request.get_json()
     
     # Validate input
@@ -66,6 +106,9 @@ def register():
             'user': new_user.to_dict()
         }), 201
         
+    except HasherBusy:
+        db.session.rollback()
+        return hashing_busy()
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f'Registration error: {str(e)}')
@@ -73,6 +116,9 @@ def register():
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
+    if get_password_hasher().busy():
+        return hashing_busy()
+    
     data = request.get_json()
     
     # Validate input
@@ -85,6 +131,14 @@ def login():
         if not user or not user.check_password(data['password']):
             return jsonify({'message': 'Invalid email or password'}), 401
         
+        # Upgrade hashes made with older parameters while we have the password
+        if user.password_needs_rehash():
+            try:
+                user.set_password(data['password'])
+                db.session.commit()
+            except HasherBusy:
+                pass  # Try again on the next login
+        
         # Create access token
         access_token = create_access_token(identity={
             'id': user.id,
@@ -97,6 +151,8 @@ def login():
             'user': user.to_dict()
         })
         
+    except HasherBusy:
+        return hashing_busy()
     except Exception as e:
         current_app.logger.error(f'Login error: {str(e)}')
         return jsonify({'message': 'Error during login'}), 500
@@ -105,13 +161,13 @@ def login():
 @jwt_required()
 def get_current_user():
     try:
-        current_user = get_jwt_identity()
-        user = User.query.get(current_user['id'])
+        # Loaded (and cached) by the JWT user lookup callback
+        user = get_jwt_user()
         
         if not user:
             return jsonify({'message': 'User not found'}), 404
             
-        return jsonify(user.to_dict())
+        return jsonify(user)
         
     except Exception as e:
         current_app.logger.error(f'Get current user error: {str(e)}')
@@ -121,8 +177,12 @@ def get_current_user():
 @jwt_required(refresh=True)
 def refresh():
     try:
-        current_user = get_jwt_identity()
-        new_token = create_access_token(identity=current_user)
+        claims = get_jwt()
+        new_token = create_access_token(identity={
+            'id': get_jwt_identity(),
+            'email': claims['email'],
+            'is_admin': claims['is_admin']
+        })
         return jsonify({'access_token': new_token})
     except Exception as e:
         current_app.logger.error(f'Token refresh error: {str(e)}')
@@ -0,0 +1,220 @@
+import csv
+import json
+from datetime import datetime
+from sqlalchemy import bindparam, case, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import Book, db
+from app.schemas import bulk_books_schema
+
+# Columns overwritten when an imported ISBN already exists
+UPSERT_COLUMNS = ('title', 'author', 'published_date', 'publisher', 'description', 'total_copies')
+
+
+class InvalidRow:
+    """Stands in for a row that could not be parsed, so it can be reported
+    against its row number"""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def iter_json_rows(data):
+    """Yield ``(row_number, row)`` from a decoded JSON array"""
+    for number, row in enumerate(data, 1):
+        yield number, row
+
+
+def decode_lines(stream, invalid):
+    """Yield the lines of a UTF-8 byte stream as text.
+
+    A line that is not valid UTF-8 is yielded with replacement characters
+    and its line number appended to ``invalid``.
+    """
+    for number, line in enumerate(stream, 1):
+        try:
+            yield line.decode('utf-8')
+        except UnicodeDecodeError:
+            invalid.append(number)
+            yield line.decode('utf-8', 'replace')
+
+
+def iter_ndjson_rows(stream):
+    """Yield ``(row_number, row)`` from a newline-delimited JSON stream.
+
+    Lines that are not valid UTF-8 or JSON are yielded as :class:`InvalidRow`.
+    """
+    invalid = []
+    number = 0
+    for line in decode_lines(stream, invalid):
+        if not line.strip():
+            continue
+        number += 1
+        if invalid:
+            invalid.clear()
+            yield number, InvalidRow('Invalid UTF-8.')
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, InvalidRow('Invalid JSON.')
+
+
+def iter_csv_rows(stream):
+    """Yield ``(row_number, row)`` from a CSV stream with a header line.
+
+    Rows read from lines that are not valid UTF-8 are yielded as
+    :class:`InvalidRow`.
+    """
+    invalid = []
+    reader = csv.DictReader(decode_lines(stream, invalid))
+    for number, row in enumerate(reader, 1):
+        if invalid:
+            invalid.clear()
+            yield number, InvalidRow('Invalid UTF-8.')
+            continue
+        # Empty cells mean "not provided", not an empty string
+        yield number, {key: value for key, value in row.items() if value not in ('', None)}
+
+
+def chunked(rows, size):
+    """Group an iterable of rows into lists of at most ``size``"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def copies_left(available, new_total, old_total):
+    """``available_copies`` once the total changes, keeping copies on loan
+    accounted for but never going below zero"""
+    available = available + new_total - old_total
+    return case((available < 0, 0), else_=available)
+
+
+def upsert_statement(dialect):
+    """Build an INSERT that updates the existing book on an ISBN conflict.
+
+    Returns ``None`` for backends without ``ON CONFLICT`` support.
+    """
+    if dialect == 'sqlite':
+        stmt = sqlite.insert(Book)
+    elif dialect == 'postgresql':
+        stmt = postgresql.insert(Book)
+    else:
+        return None
+
+    values = {column: stmt.excluded[column] for column in UPSERT_COLUMNS}
+    # Keep copies that are checked out accounted for when the total changes
+    values['available_copies'] = copies_left(
+        Book.available_copies, stmt.excluded.total_copies, Book.total_copies)
+    # Column onupdate defaults do not apply to ON CONFLICT DO UPDATE
+    values['version'] = Book.version + 1
+    values['updated_at'] = datetime.utcnow()
+    return stmt.on_conflict_do_update(index_elements=[Book.isbn], set_=values)
+
+
+def write_chunk(books, existing, dialect):
+    """Insert or update one validated chunk of books with executemany"""
+    for book in books:
+        book.setdefault('total_copies', 1)
+        book['available_copies'] = book['total_copies']
+        book.setdefault('date_added', datetime.utcnow())
+        for column in UPSERT_COLUMNS:
+            book.setdefault(column, None)
+
+    stmt = upsert_statement(dialect)
+    if stmt is not None:
+        db.session.execute(stmt, books)
+        return
+
+    # Generic fallback: plain executemany INSERT and UPDATE
+    new_books = [book for book in books if book['isbn'] not in existing]
+    updates = [{f'b_{key}': value for key, value in book.items()}
+               for book in books if book['isbn'] in existing]
+    books_table = Book.__table__
+    if new_books:
+        db.session.execute(insert(books_table), new_books)
+    if updates:
+        values = {column: bindparam(f'b_{column}') for column in UPSERT_COLUMNS}
+        values['available_copies'] = copies_left(
+            books_table.c.available_copies, bindparam('b_total_copies'),
+            books_table.c.total_copies)
+        db.session.execute(
+            update(books_table).where(books_table.c.isbn == bindparam('b_isbn')).values(values),
+            updates
+        )
+
+
+def import_books(rows, chunk_size, dialect):
+    """Validate and upsert ``(row_number, row)`` pairs, committing per chunk.
+
+    Returns a report with created/updated/failed counts and the errors for
+    each rejected row. A failing chunk is rolled back on its own; the rows
+    of other chunks are unaffected.
+    """
+    from marshmallow import ValidationError  # Only needed once there is something to import
+
+    report = {'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    seen_isbns = {}
+
+    def reject(number, errors):
+        report['failed'] += 1
+        report['errors'].append({'row': number, 'errors': errors})
+
+    for chunk in chunked(rows, chunk_size):
+        for number, row in chunk:
+            if isinstance(row, InvalidRow):
+                reject(number, {'_schema': [row.message]})
+        chunk = [(number, row) for number, row in chunk if not isinstance(row, InvalidRow)]
+        numbers = [number for number, _ in chunk]
+        data = [row for _, row in chunk]
+
+        # Validate the whole chunk in one pass
+        try:
+            loaded, errors = bulk_books_schema().load(data), {}
+        except ValidationError as e:
+            loaded, errors = e.valid_data, e.messages
+
+        # Copies out on loan per existing ISBN, which an update can't go below
+        on_loan = dict(db.session.execute(
+            select(Book.isbn, Book.total_copies - Book.available_copies)
+            .where(Book.isbn.in_([book['isbn'] for index, book in enumerate(loaded)
+                                  if index not in errors]))
+        ).all())
+
+        books, book_numbers = [], []
+        for index, (number, book) in enumerate(zip(numbers, loaded)):
+            if index in errors:
+                reject(number, errors[index])
+            elif book['isbn'] in seen_isbns:
+                reject(number, {'isbn': [f"Duplicate of row {seen_isbns[book['isbn']]}"]})
+            elif book.get('total_copies', 1) < on_loan.get(book['isbn'], 0):
+                reject(number, {'total_copies': [
+                    f"Must be at least {on_loan[book['isbn']]}, the copies on loan."]})
+            else:
+                seen_isbns[book['isbn']] = number
+                books.append(book)
+                book_numbers.append(number)
+
+        if not books:
+            continue
+
+        try:
+            existing = {book['isbn'] for book in books if book['isbn'] in on_loan}
+            write_chunk(books, existing, dialect)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for number in book_numbers:
+                reject(number, {'_schema': [f'Failed to save: {e}']})
+            continue
+
+        report['updated'] += len(existing)
+        report['created'] += len(books) - len(existing)
+
+    report['errors'].sort(key=lambda error: error['row'])
+    return report
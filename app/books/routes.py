@@ -1,12 +1,89 @@
-from flask import request, jsonify, current_app
+import base64
+import hashlib
+import json
+from math import ceil
+from flask import Response, abort, request, jsonify, current_app
 from datetime import datetime
+from werkzeug.http import is_resource_modified
+from sqlalchemy import select, tuple_
 from sqlalchemy.exc import IntegrityError
 from app.models import Book, db
-from app.books.schemas import BookSchema
+from app.books.bulk import import_books, iter_csv_rows, iter_json_rows, iter_ndjson_rows
+from app.auth import admin_required
+from app.cache import book_cache_lookup, invalidate_books
+from app.search import apply_search, search_terms
+from app.library.stats import forget_book
+from app.schemas import book_schema
 from . import bp  # Import the blueprint from the package
 
-book_schema = BookSchema()
-books_schema = BookSchema(many=True)
+def invalidate_book_totals():
+    """Drop cached listing totals after the set of books has changed"""
+    current_app.extensions['book_totals'].clear()
+
+def encode_cursor(book):
+    """Encode the listing position just after ``book`` as an opaque token"""
+    position = json.dumps([book.date_added.isoformat(), book.id])
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a token from :func:`encode_cursor` into ``(date_added, id)``"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date_added, book_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(date_added), int(book_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def book_etag(book_id, version):
+    return f'{book_id}-{version}'
+
+def listing_etag(rows, *extra):
+    """Fingerprint a listing page by its book ids and versions"""
+    fingerprint = repr(([(row.id, row.version) for row in rows], extra))
+    return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+def conditional_json(payload, etag, last_modified=None):
+    """Build a JSON response with validators, or a 304 if the client's copy is current"""
+    response = Response(payload, mimetype='application/json')
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response.make_conditional(request)
+
+def page_after(query, cursor, per_page):
+    """Keyset pagination: seek past ``cursor`` on ``(date_added, id)``.
+
+    Every page is a single index range scan, however deep into the
+    catalog it is, and no ``COUNT(*)`` is issued. One extra row is
+    fetched to find out whether another page follows.
+    """
+    if cursor:
+        query = query.filter(tuple_(Book.date_added, Book.id) < decode_cursor(cursor))
+    return query.order_by(Book.date_added.desc(), Book.id.desc()).limit(per_page + 1)
+
+def cursor_page(books, per_page):
+    """Respond with a keyset page fetched by :func:`page_after`"""
+    next_cursor = encode_cursor(books[per_page - 1]) if len(books) > per_page else None
+    return jsonify({
+        'items': [book.to_dict() for book in books[:per_page]],
+        'next_cursor': next_cursor
+    }), 200
+
+def offset_page(query, page, per_page):
+    """Order by most recently added and cut out one page"""
+    return query.order_by(Book.date_added.desc(), Book.id.desc()).limit(
+        per_page).offset((page - 1) * per_page)
+
+def totals_key(search):
+    return ' '.join(sorted(set(search_terms(search))))
+
+def listing_payload(books, total, page, per_page, with_total):
+    return current_app.json.dumps({
+        'items': [book.to_dict() for book in books],
+        'total': total,
+        'pages': (ceil(total / per_page) if total else 0) if with_total else None,
+        'current_page': page
+    })
 
 @bp.route('', methods=['GET'])
 def get_books():
@@ -14,34 +91,111 @@ def get_books():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', current_app.config['BOOKS_PER_PAGE'], type=int)
     search = request.args.get('search', '')
+    cursor = request.args.get('cursor')
     
     query = Book.query
     
-    # Apply search if provided
+    # Cursor mode is opted into with ?cursor= (empty for the first page)
+    if cursor is not None:
+        if search:
+            query = apply_search(query, Book, search, db.engine.dialect.name, rank=False)
+        per_page = min(max(per_page, 1), 100)
+        try:
+            return cursor_page(page_after(query, cursor, per_page).all(), per_page)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    
+    # Apply search if provided; matches are ranked by relevance
     if search:
-        search = f"%{search}%"
-        query = query.filter(
-            (Book.title.ilike(search)) |
-            (Book.author.ilike(search)) |
-            (Book.isbn.ilike(search))
-        )
+        query = apply_search(query, Book, search, db.engine.dialect.name)
     
-    # Order by most recently added
-    books = query.order_by(Book.date_added.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
+    # Totals are only counted when asked for and not already cached
+    with_total = request.args.get('with_total', 'true').lower() == 'true'
+    totals = current_app.extensions['book_totals']
+    total = totals.get(totals_key(search)) if with_total else None
+    if with_total and total is None:
+        total = query.order_by(None).count()
+        totals.set(totals_key(search), total)
     
-    return jsonify({
-        'items': [book.to_dict() for book in books.items],
-        'total': books.total,
-        'pages': books.pages,
-        'current_page': books.page
-    }), 200
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), 100)
+    page_query = offset_page(query, page, per_page)
+    
+    # A client revalidating its copy is answered from ids and versions
+    # alone; full rows are only loaded and serialized if something changed
+    if request.if_none_match:
+        rows = page_query.with_entities(Book.id, Book.version).all()
+        etag = listing_etag(rows, total, page, per_page)
+        if request.if_none_match.contains_weak(etag):
+            return conditional_json('', etag)
+        by_id = {book.id: book for book in Book.query.filter(Book.id.in_([r.id for r in rows]))}
+        books = [by_id[r.id] for r in rows if r.id in by_id]
+    else:
+        books = page_query.all()
+        etag = listing_etag(books, total, page, per_page)
+    
+    return conditional_json(listing_payload(books, total, page, per_page, with_total), etag)
+
+def book_meta_statement(book_id):
+    """Select just what a conditional request for a book is checked against"""
+    return select(Book.version, Book.updated_at, Book.date_added).where(Book.id == book_id)
+
+def revalidate_book(book_id, meta):
+    """Answer a conditional request from the book's metadata.
+    
+    Returns a 304 response if the client's copy is current, else None.
+    """
+    if meta is None:
+        abort(404)
+    etag = book_etag(book_id, meta.version)
+    last_modified = meta.updated_at or meta.date_added
+    if not is_resource_modified(request.environ, etag, last_modified=last_modified):
+        return conditional_json('', etag, last_modified)
+    return None
+
+def book_cache_entry(book):
+    """Serialize a book as ``version``, ``last modified`` and payload lines"""
+    return '\n'.join([
+        str(book.version),
+        (book.updated_at or book.date_added).isoformat(),
+        current_app.json.dumps(book.to_dict())
+    ])
+
+def cached_book_response(book_id, entry, status):
+    version, last_modified, payload = entry.split('\n', 2)
+    response = conditional_json(payload, book_etag(book_id, version),
+                                datetime.fromisoformat(last_modified))
+    response.headers['X-Cache'] = status
+    return response
 
 @bp.route('/<int:book_id>', methods=['GET'])
 def get_book(book_id):
-    """Get a single book by ID"""
-    book = Book.query.get_or_404(book_id)
-    return jsonify(book.to_dict()), 200
+    """Get a single book by ID, served from the book cache when possible.
+    
+    Responses carry an ETag and Last-Modified. Revalidation requests that
+    miss the cache are answered from the book's version alone.
+    """
+    cache = current_app.extensions['book_cache']
+    key, entry = book_cache_lookup(cache, book_id)
+    if entry is not None:
+        return cached_book_response(book_id, entry, 'HIT')
+    
+    if request.if_none_match or request.if_modified_since:
+        not_modified = revalidate_book(book_id, db.session.execute(
+            book_meta_statement(book_id)).first())
+        if not_modified is not None:
+            return not_modified
+    
+    entry = book_cache_entry(Book.query.get_or_404(book_id))
+    if key is not None:
+        cache.set(key, entry)
+    return cached_book_response(book_id, entry, 'MISS')
+
+@bp.route('/cache', methods=['GET'])
+@admin_required()
+def get_book_cache_stats():
+    """Get hit/miss counters for the single-book cache"""
+    return jsonify(current_app.extensions['book_cache'].stats()), 200
 
 @bp.route('', methods=['POST'])
 def create_book():
@@ -50,16 +204,18 @@ def create_book():
     
     # Validate and deserialize input
     try:
-        book_data = book_schema.load(data)
+        book_data = book_schema().load(data)
     except Exception as e:
         return jsonify({"error": "Invalid data", "details": str(e)}), 400
     
-    # Create new book
+    # Create new book; every copy starts out available
     book = Book(**book_data)
+    book.available_copies = book.total_copies
     
     try:
         db.session.add(book)
         db.session.commit()
+        invalidate_book_totals()
         return jsonify(book.to_dict()), 201
     except IntegrityError:
         db.session.rollback()
@@ -68,6 +224,35 @@ def create_book():
         db.session.rollback()
         return jsonify({"error": "Failed to create book", "details": str(e)}), 500
 
+@bp.route('/bulk', methods=['POST'])
+def bulk_import_books():
+    """Create or update many books at once, upserting by ISBN.
+    
+    Accepts a JSON array, or a streamed NDJSON or CSV body. Rows are
+    validated and written in chunks; invalid rows are reported back
+    instead of failing the whole import.
+    """
+    chunk_size = request.args.get(
+        'chunk_size', current_app.config['BULK_IMPORT_CHUNK_SIZE'], type=int)
+    
+    if request.mimetype == 'application/x-ndjson':
+        rows = iter_ndjson_rows(request.stream)
+    elif request.mimetype == 'text/csv':
+        rows = iter_csv_rows(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            return jsonify({"error": "Expected a JSON array of books"}), 400
+        rows = iter_json_rows(data)
+    
+    report = import_books(rows, max(chunk_size, 1), db.engine.dialect.name)
+    if report['created'] or report['updated']:
+        invalidate_book_totals()
+    if report['updated']:
+        # Updated rows are matched by ISBN, so their ids are not known here
+        current_app.extensions['book_cache'].clear()
+    return jsonify(report), 200
+
 @bp.route('/<int:book_id>', methods=['PUT'])
 def update_book(book_id):
     """Update an existing book"""
@@ -76,7 +261,7 @@ def update_book(book_id):
     
     # Validate and deserialize input
     try:
-        book_data = book_schema.load(data, partial=True)
+        book_data = book_schema().load(data, partial=True)
     except Exception as e:
         return jsonify({"error": "Invalid data", "details": str(e)}), 400
     
@@ -86,6 +271,9 @@ def update_book(book_id):
     
     try:
         db.session.commit()
+        # Edits can change which searches a book matches
+        invalidate_book_totals()
+        invalidate_books(book_id)
         return jsonify(book.to_dict()), 200
     except IntegrityError:
         db.session.rollback()
@@ -100,8 +288,12 @@ def delete_book(book_id):
     book = Book.query.get_or_404(book_id)
     
     try:
+        # Its checkouts go with it, so they leave the statistics too
+        forget_book(book_id)
         db.session.delete(book)
         db.session.commit()
+        invalidate_book_totals()
+        invalidate_books(book_id)
         return '', 204
     except Exception as e:
         db.session.rollback()
@@ -1,5 +1,5 @@
-from marshmallow import Schema, fields, validate, validates, ValidationError
-from datetime import datetime
+from marshmallow import Schema, fields, validate, validates, post_load, ValidationError
+from datetime import datetime, timezone
 
 class BookSchema(Schema):
     id = fields.Int(dump_only=True)
@@ -36,5 +36,14 @@ class CheckoutSchema(Schema):
     
     @validates('due_date')
     def validate_due_date(self, value):
-        if value <= datetime.now():
+        now = datetime.now(timezone.utc) if value.tzinfo else datetime.utcnow()
+        if value <= now:
             raise ValidationError("Due date must be in the future")
+    
+    @post_load
+    def normalize_due_date(self, data, **kwargs):
+        """Store due dates as naive UTC, like every other timestamp"""
+        due_date = data.get('due_date')
+        if due_date is not None and due_date.tzinfo is not None:
+            data['due_date'] = due_date.astimezone(timezone.utc).replace(tzinfo=None)
+        return data
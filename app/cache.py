@@ -0,0 +1,181 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import current_app
+
+
+class TTLCache:
+    """A thread-safe, size-bounded in-process LRU cache whose entries expire.
+
+    When full, the least recently used entry is evicted to make room. A
+    ``ttl`` of 0 disables the cache entirely.
+    """
+
+    def __init__(self, ttl, maxsize=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (self._clock() + self.ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def generation(self, key):
+        """The token stored at ``key``, storing a new one if there is none.
+        Returns None when the cache is disabled."""
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= self._clock():
+                self._data.pop(key, None)
+                entry = self._data[key] = (self._clock() + self.ttl, new_generation())
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+            else:
+                self._data.move_to_end(key)
+            return entry[1]
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'backend': 'memory', 'hits': self.hits, 'misses': self.misses,
+                'size': len(self._data)}
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache:
+    """A cache shared between processes, stored in Redis.
+
+    ``client`` only needs ``get``, ``set(name, value, ex=...)``, ``delete``
+    and ``scan_iter``, so any compatible client (or a stand-in) works.
+    Hit and miss counters are kept per process.
+    """
+
+    def __init__(self, client, ttl, prefix='cache:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value.decode() if isinstance(value, bytes) else value
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def generation(self, key):
+        """The token stored at ``key``, storing a new one if there is none.
+        Returns None when the cache is disabled."""
+        if self.ttl <= 0:
+            return None
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            value = new_generation()
+            # Only one of several racing readers gets to store its token
+            if not self.client.set(self.prefix + key, value, ex=self.ttl, nx=True):
+                value = self.client.get(self.prefix + key) or value
+        return value.decode() if isinstance(value, bytes) else value
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        return {'backend': 'redis', 'hits': self.hits, 'misses': self.misses}
+
+
+def create_cache(ttl, maxsize, redis_url=None, prefix='cache:'):
+    """Create a shared Redis cache if ``redis_url`` is set, else an in-process one"""
+    if redis_url:
+        # Optional dependency, only needed when a shared cache is configured
+        import redis
+        return RedisCache(redis.Redis.from_url(redis_url), ttl, prefix)
+    return TTLCache(ttl, maxsize)
+
+
+def new_generation():
+    return uuid.uuid4().hex[:12]
+
+
+# Entries that must not outlive a write (books, users) are cached under
+# keys stamped with a generation, a random token stored at the entry's
+# name. Writers drop the token after committing, so the next reader starts
+# a new generation. A reader that loaded the row before the write still
+# stores its copy under the old token, where nobody looks for it, rather
+# than putting a stale entry back.
+
+def generation_lookup(cache, name):
+    """``(key, entry)`` of the current entry called ``name``; ``entry`` is
+    None on a miss, and ``key`` too if the cache is disabled.
+
+    Call it before reading the row from the database, so an entry stored
+    under ``key`` is never older than the generation.
+    """
+    generation = cache.generation(name)
+    if generation is None:
+        return None, None
+    key = f'{name}:{generation}'
+    return key, cache.get(key)
+
+
+def book_cache_name(book_id):
+    return f'book:{book_id}'
+
+
+def book_cache_lookup(cache, book_id):
+    return generation_lookup(cache, book_cache_name(book_id))
+
+
+def invalidate_books(*book_ids):
+    """Retire the cached payloads of the given books; call after committing"""
+    current_app.extensions['book_cache'].delete(*(book_cache_name(i) for i in book_ids))
+
+
+def user_cache_name(user_id):
+    return f'user:{user_id}'
@@ -0,0 +1,72 @@
+"""Application-level ``flask`` commands.
+
+Their implementations are imported when a command runs, not when the app
+is created, so commands cost nothing at start-up.
+"""
+import time
+import click
+from flask.cli import ScriptInfo, with_appcontext
+from app.models import Book, Checkout, User, db
+
+
+@click.command('create-tables')
+@with_appcontext
+def create_tables_command():
+    """Create any missing tables (use `flask db upgrade` for real databases)."""
+    db.create_all()
+    click.echo('Tables created.')
+
+
+@click.command('seed')
+@click.option('--books', default=100_000, show_default=True)
+@click.option('--users', default=10_000, show_default=True)
+@click.option('--checkouts', default=200_000, show_default=True)
+@click.option('--seed', 'seed', default=0, show_default=True,
+              help='Random seed; the same seed gives the same data.')
+@click.option('--batch-size', default=50_000, show_default=True,
+              help='Rows per INSERT batch.')
+@with_appcontext
+def seed_command(books, users, checkouts, seed, batch_size):
+    """Fill an empty database with synthetic users, books and checkouts."""
+    from app.seed import SEED_PASSWORD, seed_database
+
+    db.create_all()
+    for model in (User, Book, Checkout):
+        if db.session.scalar(db.select(model.id).limit(1)) is not None:
+            raise click.ClickException(f'{model.__tablename__} is not empty; seed an empty database')
+    if users < 1 and checkouts:
+        raise click.ClickException('Checkouts need at least one user')
+    if books < 1 and checkouts:
+        raise click.ClickException('Checkouts need at least one book')
+
+    started = time.perf_counter()
+    counts = seed_database(books, users, checkouts, seed=seed, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+    rows = sum(counts.values())
+    click.echo(', '.join(f'{count} {table}' for table, count in counts.items())
+               + f' in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s).')
+    click.echo(f'Seeded users log in with the password {SEED_PASSWORD!r}.')
+
+
+class MigrateGroup(click.Group):
+    """``flask db``, with Flask-Migrate and Alembic only imported when it runs"""
+
+    def _commands(self, ctx):
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as db_commands
+        app = ctx.ensure_object(ScriptInfo).load_app()
+        if 'migrate' not in app.extensions:
+            Migrate(app, db)
+        return db_commands
+
+    def list_commands(self, ctx):
+        return self._commands(ctx).list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._commands(ctx).get_command(ctx, name)
+
+
+def init_cli(app):
+    app.cli.add_command(create_tables_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(MigrateGroup('db', help='Perform database migrations.'))
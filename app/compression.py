@@ -0,0 +1,57 @@
+import gzip
+import zlib
+from flask import request
+
+# Encodings we can produce, in order of preference
+ENCODINGS = ('gzip', 'deflate')
+
+
+def choose_encoding(accept_encodings):
+    """Pick the best supported encoding the client accepts, or None"""
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, level):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    return zlib.compress(data, level)
+
+
+def init_compression(app):
+    """Compress responses negotiated via Accept-Encoding.
+
+    Only complete (non-streamed) successful responses of a compressible
+    type and at least ``COMPRESS_MIN_SIZE`` bytes are compressed.
+    """
+
+    @app.after_request
+    def compress_response(response):
+        if not app.config['COMPRESS_ENABLED']:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200
+                or response.is_streamed
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in app.config['COMPRESS_MIMETYPES']):
+            return response
+
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        response.set_data(compress(data, encoding, app.config['COMPRESS_LEVEL']))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body is a different representation of the same data
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,100 @@
+"""Cross-origin resource sharing for the API.
+
+Header sets are built once per allowed origin when the app is created, so
+a request only costs a dictionary lookup. The layer wraps the WSGI app:
+preflight ``OPTIONS`` requests are answered before routing, hooks or JWT
+checks run, with ``Access-Control-Max-Age`` so browsers cache the answer
+instead of preflighting every call.
+"""
+
+# Allows any origin in CORS_ORIGINS
+ANY_ORIGIN = '*'
+
+
+class CORSMiddleware:
+    """Add CORS headers to responses under ``prefix`` and answer preflights"""
+
+    def __init__(self, wsgi_app, origins, prefix='/api/', supports_credentials=True,
+                 allow_headers=(), methods=(), expose_headers=(), max_age=None):
+        self.wsgi_app = wsgi_app
+        self.prefix = prefix
+        self.any_origin = ANY_ORIGIN in origins
+        # A wildcard can't be sent with credentials, so the origin is echoed instead
+        self.echo_origin = self.any_origin and supports_credentials
+
+        shared = []
+        if supports_credentials:
+            shared.append(('Access-Control-Allow-Credentials', 'true'))
+        if expose_headers:
+            shared.append(('Access-Control-Expose-Headers', ', '.join(expose_headers)))
+        preflight = [('Access-Control-Allow-Methods', ', '.join(methods)),
+                     ('Access-Control-Allow-Headers', ', '.join(allow_headers))]
+        if max_age is not None:
+            preflight.append(('Access-Control-Max-Age', str(max_age)))
+        self.shared, self.shared_preflight = shared, shared + preflight
+
+        # Answers depend on Origin unless every origin gets the same wildcard
+        self.vary = self.echo_origin or not self.any_origin
+        self.headers = {origin: self._allow(origin) for origin in origins}
+        self.preflight_headers = {origin: self._allow(origin, preflight=True) for origin in origins}
+        self.refused = [('Vary', 'Origin')] if self.vary else []
+
+    def _allow(self, origin, preflight=False):
+        headers = [('Access-Control-Allow-Origin', origin)]
+        headers.extend(self.shared_preflight if preflight else self.shared)
+        if self.vary:
+            headers.append(('Vary', 'Origin'))
+        return headers
+
+    def headers_for(self, origin, preflight=False):
+        """The CORS headers for a request from ``origin``, or None if it isn't allowed"""
+        allowed = self.preflight_headers if preflight else self.headers
+        headers = allowed.get(origin)
+        if headers is None and origin and self.any_origin:
+            headers = self._allow(origin, preflight) if self.echo_origin else allowed[ANY_ORIGIN]
+        return headers
+
+    def __call__(self, environ, start_response):
+        if not environ.get('PATH_INFO', '').startswith(self.prefix):
+            return self.wsgi_app(environ, start_response)
+        origin = environ.get('HTTP_ORIGIN')
+
+        if (environ['REQUEST_METHOD'] == 'OPTIONS'
+                and 'HTTP_ACCESS_CONTROL_REQUEST_METHOD' in environ):
+            headers = self.headers_for(origin, preflight=True) or self.refused
+            start_response('204 No Content', headers + [('Content-Length', '0')])
+            return []
+
+        cors = self.headers_for(origin) or self.refused
+
+        def add_cors_headers(status, headers, exc_info=None):
+            for name, value in cors:
+                if name == 'Vary':
+                    add_vary(headers, value)
+                else:
+                    headers.append((name, value))
+            return start_response(status, headers, exc_info)
+
+        return self.wsgi_app(environ, add_cors_headers)
+
+
+def add_vary(headers, value):
+    """Add ``value`` to the Vary header in a WSGI header list"""
+    for i, (name, existing) in enumerate(headers):
+        if name.lower() == 'vary':
+            headers[i] = (name, f'{existing}, {value}')
+            return
+    headers.append(('Vary', value))
+
+
+def init_cors(app):
+    """Serve the API to the origins in ``CORS_ORIGINS``"""
+    app.wsgi_app = CORSMiddleware(
+        app.wsgi_app,
+        origins=app.config['CORS_ORIGINS'],
+        prefix=app.config['CORS_PATH_PREFIX'],
+        supports_credentials=app.config['CORS_SUPPORTS_CREDENTIALS'],
+        allow_headers=app.config['CORS_ALLOW_HEADERS'],
+        methods=app.config['CORS_METHODS'],
+        expose_headers=app.config['CORS_EXPOSE_HEADERS'],
+        max_age=app.config['CORS_MAX_AGE'])
@@ -0,0 +1,85 @@
+import itertools
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+# Requests whose reads may be served by a replica
+REPLICA_METHODS = frozenset({'GET', 'HEAD'})
+
+
+def is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def configure_engine_options(app):
+    """Fill in pool settings for server databases.
+
+    Explicit ``SQLALCHEMY_ENGINE_OPTIONS`` win. SQLite keeps the pool
+    Flask-SQLAlchemy picks for it, which ``pool_size`` and friends don't
+    apply to for in-memory databases.
+    """
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.setdefault('pool_pre_ping', app.config['DATABASE_POOL_PRE_PING'])
+    if not is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        options.setdefault('pool_size', app.config['DATABASE_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['DATABASE_MAX_OVERFLOW'])
+        options.setdefault('pool_recycle', app.config['DATABASE_POOL_RECYCLE'])
+        options.setdefault('pool_timeout', app.config['DATABASE_POOL_TIMEOUT'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def set_sqlite_pragmas(engine, pragmas):
+    """Apply ``PRAGMA name=value`` to every new connection of a SQLite engine"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def create_replica_engines(app):
+    """Create an engine for each of ``SQLALCHEMY_REPLICA_URIS``.
+
+    Replicas are kept out of ``SQLALCHEMY_BINDS``: no model is bound to
+    them, and the session routes to them itself.
+    """
+    engines = []
+    for uri in app.config['SQLALCHEMY_REPLICA_URIS']:
+        engine = create_engine(uri, **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        set_sqlite_pragmas(engine, app.config['SQLITE_PRAGMAS'])
+        engines.append(engine)
+    app.extensions['replicas'] = itertools.cycle(engines) if engines else None
+    return engines
+
+
+def reads_from_replica():
+    return (has_request_context()
+            and request.method in REPLICA_METHODS
+            and current_app.extensions.get('replicas') is not None)
+
+
+class RoutingSession(Session):
+    """Session that serves the reads of GET and HEAD requests from a replica.
+
+    Each session (one per request) picks a replica round-robin on its first
+    read and keeps it. Once the session writes, whether by flushing or by
+    executing an INSERT/UPDATE/DELETE, it sticks to the primary so the
+    request reads its own writes. Models with their own bind are untouched.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or engine is not self._db.engines.get(None):
+            return engine
+        if self._flushing or getattr(clause, 'is_dml', False):
+            self.info['primary'] = True
+        if self.info.get('primary') or not reads_from_replica():
+            return engine
+        if 'replica' not in self.info:
+            self.info['replica'] = next(current_app.extensions['replicas'])
+        return self.info['replica']
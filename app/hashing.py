@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from flask import current_app
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+)
+
+
+class HasherBusy(Exception):
+    """Raised when too many hashes are pending; the client should retry later"""
+
+
+def parse_method(method):
+    """Werkzeug method string as the parameters it hashes with, filling in
+    Werkzeug's defaults, so ``'pbkdf2:sha256'`` equals ``'pbkdf2:sha256:600000'``"""
+    name, *args = method.split(':')
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return name, hash_name, iterations
+    if name == 'scrypt':
+        return (name, *(map(int, args) if args else (2 ** 15, 8, 1)))
+    return (name, *args)
+
+
+class PasswordHasher:
+    """Hash and check passwords off the request thread, with backpressure.
+
+    Key derivation is deliberately slow, so it runs in a pool of
+    ``workers`` processes where it doesn't hold the GIL. At most
+    ``max_pending`` hashes may be running or queued at once; past that,
+    :class:`HasherBusy` is raised straight away rather than tying up
+    another request worker. ``workers=0`` hashes in the calling thread and
+    ``max_pending=None`` removes the limit. Workers run ``niceness`` steps
+    below normal CPU priority, so a burst of logins doesn't starve the
+    request threads serving everything else.
+
+    ``method`` is a Werkzeug method string such as
+    ``'pbkdf2:sha256:600000'`` or ``'scrypt:32768:8:1'``; hashes made with
+    other parameters are reported by :meth:`needs_rehash`.
+    """
+
+    def __init__(self, method, workers=0, max_pending=None, timeout=None, niceness=0):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self.niceness = niceness
+        self._slots = threading.BoundedSemaphore(max_pending) if max_pending else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def busy(self):
+        """Whether a hash would be turned away right now, so a request can
+        answer 503 before doing any other work"""
+        if self._slots is None:
+            return False
+        if not self._slots.acquire(blocking=False):
+            return True
+        self._slots.release()
+        return False
+
+    def needs_rehash(self, pwhash):
+        """Whether ``pwhash`` was made with other parameters than ``method``"""
+        return parse_method(pwhash.split('$', 1)[0]) != parse_method(self.method)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Forking a threaded server is unsafe; start clean interpreters
+                lower_priority = self.niceness and hasattr(os, 'nice')
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=os.nice if lower_priority else None,
+                    initargs=(self.niceness,) if lower_priority else ())
+            return self._executor
+
+    def _run(self, fn, *args):
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        if not self.workers:
+            try:
+                return fn(*args)
+            finally:
+                self._release()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the job ends, even if we stop waiting for
+        # it: a running job can't be cancelled, and still occupies a worker
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HasherBusy()
+
+    def _release(self, future=None):
+        if self._slots is not None:
+            self._slots.release()
+
+
+def create_password_hasher(config):
+    return PasswordHasher(
+        method=config['PASSWORD_HASH_METHOD'],
+        workers=config['PASSWORD_HASH_WORKERS'],
+        max_pending=config['PASSWORD_HASH_MAX_PENDING'],
+        timeout=config['PASSWORD_HASH_TIMEOUT'],
+        niceness=config['PASSWORD_HASH_NICENESS'])
+
+
+def get_password_hasher():
+    return current_app.extensions['password_hasher']
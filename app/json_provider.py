@@ -0,0 +1,58 @@
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+class JSONProvider(DefaultJSONProvider):
+    """JSON provider that writes dates and datetimes as ISO 8601.
+
+    Models and routes hand ``date``/``datetime`` values straight to
+    ``jsonify``; Flask's default provider would render them as HTTP dates.
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, which serializes dates natively.
+
+    Output matches :class:`JSONProvider`, only faster.
+    """
+
+    def _options(self, indent=None, **kwargs):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options(**kwargs)).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent=indent))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def get_json_provider_class(name):
+    """Return the provider class for the ``JSON_PROVIDER`` setting.
+
+    ``'orjson'`` falls back to the standard library when orjson is missing.
+    """
+    if name == 'orjson' and orjson is not None:
+        return OrjsonProvider
+    return JSONProvider
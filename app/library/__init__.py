@@ -4,7 +4,7 @@ from flask import Blueprint
 bp = Blueprint('library', __name__)
 
 # Import routes after creating blueprint to avoid circular imports
-from . import routes
+from . import routes, overdue, stats
 
 # This makes the blueprint available when importing from app.library
 __all__ = ['bp']
@@ -1,16 +1,63 @@
-from flask import request, jsonify, current_app
-from datetime import datetime, timedelta
+import csv
+import io
+from collections import defaultdict
+from flask import Response, request, jsonify, current_app, stream_with_context, url_for
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import case, false, func, select, true, union_all, update
 from sqlalchemy.exc import IntegrityError
-from app.models import Book, Checkout, db
-from app.books.schemas import CheckoutSchema
+from app.cache import invalidate_books
+from app.models import Book, BookStats, Checkout, CirculationTotals, User, UserStats, db
+from app.schemas import checkout_schema
+from app.library.stats import record_circulation
 from . import bp  # Import the blueprint from the package
 
-checkout_schema = CheckoutSchema()
 
 def calculate_due_date():
     """Calculate due date (14 days from now)"""
     return datetime.utcnow() + timedelta(days=14)
 
+def adjust_copies_statement(changes):
+    """A single conditional UPDATE applying ``{book_id: delta}`` changes.
+    
+    It both checks and changes the counters, so concurrent checkouts can
+    never oversell a title. It matches fewer rows than ``changes`` when a
+    book does not exist or would drop below zero copies.
+    """
+    delta = case(changes, value=Book.id)
+    return (
+        update(Book)
+        .where(Book.id.in_(changes), Book.available_copies + delta >= 0)
+        .values(available_copies=Book.available_copies + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+def adjust_copies(changes):
+    """Atomically apply ``{book_id: delta}`` changes to available copies.
+    
+    Returns False when a book does not exist or would drop below zero
+    copies; the caller must then roll back, as other books in ``changes``
+    may have been updated.
+    """
+    result = db.session.execute(adjust_copies_statement(changes))
+    return result.rowcount == len(changes)
+
+def active_checkout_statement(book_id, user_id):
+    return select(Checkout.id).where(
+        Checkout.book_id == book_id,
+        Checkout.user_id == user_id,
+        Checkout.return_date.is_(None)
+    ).limit(1)
+
+def close_checkout_statement(checkout_id, return_date):
+    """Close a checkout only if it is still open, so a concurrent return of
+    the same checkout cannot put the copy back twice"""
+    return (
+        update(Checkout)
+        .where(Checkout.id == checkout_id, Checkout.return_date.is_(None))
+        .values(return_date=return_date, overdue=False)
+        .execution_options(synchronize_session=False)
+    )
+
 @bp.route('/checkout', methods=['POST'])
 def checkout_book():
     """Check out a book from the library"""
@@ -18,31 +65,24 @@ def checkout_book():
     
     # Validate input
     try:
-        checkout_data = checkout_schema.load(data)
+        checkout_data = checkout_schema().load(data)
     except Exception as e:
         return jsonify({"error": "Invalid data", "details": str(e)}), 400
     
     book_id = checkout_data['book_id']
     user_id = checkout_data['user_id']
     
-    # Check if book exists and is available
-    book = Book.query.get(book_id)
-    if not book:
-        return jsonify({"error": "Book not found"}), 404
-    
-    if book.available_copies <= 0:
-        return jsonify({"error": "No available copies of this book"}), 400
-    
     # Check if user already has this book checked out
-    active_checkout = Checkout.query.filter_by(
-        book_id=book_id,
-        user_id=user_id,
-        return_date=None
-    ).first()
-    
-    if active_checkout:
+    if db.session.execute(active_checkout_statement(book_id, user_id)).first():
         return jsonify({"error": "You already have this book checked out"}), 400
     
+    # Reserve a copy; only look the book up again to explain a failure
+    if not adjust_copies({book_id: -1}):
+        db.session.rollback()
+        if db.session.get(Book, book_id) is None:
+            return jsonify({"error": "Book not found"}), 404
+        return jsonify({"error": "No available copies of this book"}), 400
+    
     # Create checkout record
     due_date = checkout_data.get('due_date') or calculate_due_date()
     checkout = Checkout(
@@ -51,16 +91,17 @@ def checkout_book():
         due_date=due_date
     )
     
-    # Update book available copies
-    book.available_copies -= 1
-    
     try:
         db.session.add(checkout)
+        db.session.flush()
+        checkout_id = checkout.id
+        record_circulation(checkouts=[(book_id, user_id)])
         db.session.commit()
+        invalidate_books(book_id)
         return jsonify({
             "message": "Book checked out successfully",
-            "checkout_id": checkout.id,
-            "due_date": checkout.due_date.isoformat()
+            "checkout_id": checkout_id,
+            "due_date": due_date
         }), 200
     except Exception as e:
         db.session.rollback()
@@ -69,69 +110,414 @@ def checkout_book():
 @bp.route('/return/<int:checkout_id>', methods=['POST'])
 def return_book(checkout_id):
     """Return a checked out book"""
-    checkout = Checkout.query.get(checkout_id)
+    checkout = db.session.get(Checkout, checkout_id)
     
     if not checkout:
         return jsonify({"error": "Checkout record not found"}), 404
     
-    if checkout.return_date is not None:
+    return_date = datetime.utcnow()
+    result = db.session.execute(close_checkout_statement(checkout_id, return_date))
+    if result.rowcount == 0:
+        db.session.rollback()
         return jsonify({"error": "This book has already been returned"}), 400
     
-    # Update checkout record
-    checkout.return_date = datetime.utcnow()
-    
     # Update book available copies
-    book = Book.query.get(checkout.book_id)
-    if book:
-        book.available_copies += 1
+    book_id = checkout.book_id
+    adjust_copies({book_id: 1})
     
     try:
+        record_circulation(returns=[(book_id, checkout.user_id)])
         db.session.commit()
+        invalidate_books(book_id)
         return jsonify({
             "message": "Book returned successfully",
-            "checkout_id": checkout.id,
-            "return_date": checkout.return_date.isoformat()
+            "checkout_id": checkout_id,
+            "return_date": return_date
         }), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Failed to return book", "details": str(e)}), 500
 
+@bp.route('/batch', methods=['POST'])
+def process_batch():
+    """Process many checkouts and returns in a single transaction.
+    
+    Books and active checkouts are prefetched with one ``IN`` query each.
+    Every item gets its own status; items that fail are skipped while the
+    rest are committed together, returns first so that returned copies
+    can be checked out again in the same batch.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    checkout_items = data.get('checkouts', [])
+    return_ids = data.get('returns', [])
+    
+    if not isinstance(checkout_items, list) or not isinstance(return_ids, list):
+        return jsonify({"error": "checkouts and returns must be lists"}), 400
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in return_ids):
+        return jsonify({"error": "returns must be a list of checkout ids"}), 400
+    if len(checkout_items) + len(return_ids) > current_app.config['LIBRARY_BATCH_MAX_ITEMS']:
+        return jsonify({"error": "Too many items in batch"}), 400
+    
+    # Validate checkout requests up front
+    loaded = []
+    for item in checkout_items:
+        try:
+            loaded.append(checkout_schema().load(item))
+        except Exception as e:
+            loaded.append(e)
+    valid = [c for c in loaded if isinstance(c, dict)]
+    
+    # Prefetch everything the batch touches
+    returns = {c.id: c for c in Checkout.query.filter(
+        Checkout.id.in_(return_ids))} if return_ids else {}
+    book_ids = {c['book_id'] for c in valid} | {c.book_id for c in returns.values()}
+    available = dict(db.session.query(Book.id, Book.available_copies).filter(
+        Book.id.in_(book_ids))) if book_ids else {}
+    active = {(c.book_id, c.user_id) for c in Checkout.query.filter(
+        Checkout.book_id.in_({c['book_id'] for c in valid}),
+        Checkout.user_id.in_({c['user_id'] for c in valid}),
+        Checkout.return_date.is_(None)
+    )} if valid else set()
+    
+    now = datetime.utcnow()
+    changes = defaultdict(int)
+    return_results, returned_ids = [], []
+    for checkout_id in return_ids:
+        checkout = returns.get(checkout_id)
+        if checkout is None:
+            return_results.append({'checkout_id': checkout_id, 'status': 'error',
+                                   'error': 'Checkout record not found'})
+            continue
+        if checkout.return_date is not None or checkout_id in returned_ids:
+            return_results.append({'checkout_id': checkout_id, 'status': 'error',
+                                   'error': 'This book has already been returned'})
+            continue
+        returned_ids.append(checkout_id)
+        active.discard((checkout.book_id, checkout.user_id))
+        if checkout.book_id in available:
+            available[checkout.book_id] += 1
+            changes[checkout.book_id] += 1
+        return_results.append({'checkout_id': checkout_id, 'status': 'ok',
+                               'return_date': now})
+    
+    checkout_results, new_checkouts = [], []
+    for index, item in enumerate(loaded):
+        if not isinstance(item, dict):
+            checkout_results.append({'index': index, 'status': 'error',
+                                     'error': 'Invalid data', 'details': str(item)})
+            continue
+        book_id = item['book_id']
+        key = (book_id, item['user_id'])
+        if book_id not in available:
+            error = 'Book not found'
+        elif available[book_id] <= 0:
+            error = 'No available copies of this book'
+        elif key in active:
+            error = 'You already have this book checked out'
+        else:
+            error = None
+        if error:
+            checkout_results.append({'index': index, 'status': 'error', 'error': error})
+            continue
+        available[book_id] -= 1
+        changes[book_id] -= 1
+        active.add(key)
+        checkout = Checkout(
+            book_id=book_id,
+            user_id=item['user_id'],
+            due_date=item.get('due_date') or calculate_due_date()
+        )
+        new_checkouts.append(checkout)
+        checkout_results.append({'index': index, 'status': 'ok'})
+    
+    # Apply everything with a few set-based statements. If a concurrent
+    # request got in first the whole batch is rolled back for a retry.
+    try:
+        if returned_ids:
+            result = db.session.execute(
+                update(Checkout)
+                .where(Checkout.id.in_(returned_ids), Checkout.return_date.is_(None))
+                .values(return_date=now, overdue=False)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != len(returned_ids):
+                db.session.rollback()
+                return jsonify({"error": "Batch conflicted with another update, please retry"}), 409
+        
+        changes = {book_id: delta for book_id, delta in changes.items() if delta}
+        if changes and not adjust_copies(changes):
+            db.session.rollback()
+            return jsonify({"error": "Batch conflicted with another update, please retry"}), 409
+        
+        db.session.add_all(new_checkouts)
+        # Flush first so new ids can be read without reloading each row
+        db.session.flush()
+        created = iter(new_checkouts)
+        for result in checkout_results:
+            if result['status'] == 'ok':
+                checkout = next(created)
+                result['checkout_id'] = checkout.id
+                result['due_date'] = checkout.due_date
+        record_circulation(
+            checkouts=[(c.book_id, c.user_id) for c in new_checkouts],
+            returns=[(returns[i].book_id, returns[i].user_id) for i in returned_ids]
+        )
+        db.session.commit()
+        invalidate_books(*changes)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "Failed to process batch", "details": str(e)}), 500
+    
+    return jsonify({
+        'checkouts': checkout_results,
+        'returns': return_results
+    }), 200
+
+def user_checkouts_statement(user_id, active_only):
+    """Select a user's checkouts, newest first, with each book's title"""
+    # Fetch the book title in the same query instead of lazy-loading c.book
+    stmt = select(
+        Checkout.id,
+        Checkout.book_id,
+        Checkout.checkout_date,
+        Checkout.due_date,
+        Checkout.return_date,
+        Book.title.label('book_title')
+    ).outerjoin(Book, Book.id == Checkout.book_id).where(Checkout.user_id == user_id)
+    
+    if active_only:
+        stmt = stmt.where(Checkout.return_date.is_(None))
+    
+    return stmt.order_by(Checkout.checkout_date.desc())
+
+def user_checkout_row(c, now):
+    """Serialize one row of :func:`user_checkouts_statement` as a dict"""
+    return {
+        'id': c.id,
+        'book_id': c.book_id,
+        'book_title': c.book_title or 'Unknown Book',
+        'checkout_date': c.checkout_date,
+        'due_date': c.due_date,
+        'return_date': c.return_date,
+        'is_overdue': c.return_date is None and c.due_date < now
+    }
+
 @bp.route('/user/<int:user_id>', methods=['GET'])
 def get_user_checkouts(user_id):
     """Get all checkouts for a user"""
     active_only = request.args.get('active', 'true').lower() == 'true'
+    checkouts = db.session.execute(user_checkouts_statement(user_id, active_only)).all()
+    now = datetime.utcnow()
+    return jsonify([user_checkout_row(c, now) for c in checkouts]), 200
+
+OVERDUE_FIELDS = ['checkout_id', 'book_id', 'book_title', 'user_id',
+                  'checkout_date', 'due_date', 'days_overdue']
+
+# Rows fetched per round-trip when streaming a report
+STREAM_BATCH_SIZE = 1000
+
+def overdue_row(c, now):
+    """Serialize one overdue checkout row as a dict"""
+    return {
+        'checkout_id': c.id,
+        'book_id': c.book_id,
+        'book_title': c.book_title or 'Unknown Book',
+        'user_id': c.user_id,
+        'checkout_date': c.checkout_date,
+        'due_date': c.due_date,
+        'days_overdue': (now.date() - c.due_date.date()).days
+    }
+
+def stream_overdue_ndjson(rows, now):
+    """Yield overdue rows as newline-delimited JSON, a batch at a time"""
+    lines = []
+    for c in rows:
+        lines.append(current_app.json.dumps(overdue_row(c, now)))
+        if len(lines) >= STREAM_BATCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def stream_overdue_csv(rows, now):
+    """Yield overdue rows as CSV with a header line, a batch at a time"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=OVERDUE_FIELDS)
+    writer.writeheader()
+    for count, c in enumerate(rows, 1):
+        row = overdue_row(c, now)
+        # CSV has no native date type; write the same ISO 8601 text as JSON
+        writer.writerow({key: value.isoformat() if isinstance(value, date) else value
+                         for key, value in row.items()})
+        if count % STREAM_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def overdue_statement(now, user_id=None, min_days=None, max_days=None):
+    """Select open checkouts past their due date, most overdue first.
     
-    query = Checkout.query.filter_by(user_id=user_id)
-    
-    if active_only:
-        query = query.filter(Checkout.return_date.is_(None))
+    Checkouts the sweeper has flagged are read from the small partial
+    overdue indexes, and ones whose due date passed since the last sweep
+    (all of them, if no sweeper runs) from the partial index of unflagged
+    open checkouts, so the report is current either way. The two are
+    separate branches of a UNION ALL so each can use its own index.
+    ``min_days``/``max_days`` bound ``days_overdue`` as of ``now``.
+    """
+    today = now.date()
+    filters = []
+    if user_id is not None:
+        filters.append(Checkout.user_id == user_id)
+    if min_days is not None:
+        filters.append(Checkout.due_date < datetime.combine(
+            today - timedelta(days=min_days - 1), time.min))
+    if max_days is not None:
+        filters.append(Checkout.due_date >= datetime.combine(
+            today - timedelta(days=max_days), time.min))
     
-    checkouts = query.order_by(Checkout.checkout_date.desc()).all()
+    # Fetch the book title in the same query instead of lazy-loading c.book
+    # id is labelled so SQLite can match the union's ORDER BY against it
+    columns = select(
+        Checkout.id.label('id'),
+        Checkout.book_id,
+        Checkout.user_id,
+        Checkout.checkout_date,
+        Checkout.due_date,
+        Book.title.label('book_title')
+    ).outerjoin(Book, Book.id == Checkout.book_id).where(*filters)
+    flagged = columns.where(Checkout.overdue == true())
+    unflagged = columns.where(Checkout.return_date.is_(None), Checkout.overdue == false(),
+                              Checkout.due_date < now)
     
-    return jsonify([{
-        'id': c.id,
-        'book_id': c.book_id,
-        'book_title': c.book.title if c.book else 'Unknown Book',
-        'checkout_date': c.checkout_date.isoformat(),
-        'due_date': c.due_date.isoformat(),
-        'return_date': c.return_date.isoformat() if c.return_date else None,
-        'is_overdue': c.return_date is None and c.due_date < datetime.utcnow()
-    } for c in checkouts]), 200
+    return union_all(flagged, unflagged).order_by('due_date', 'id')
+
+def overdue_filters():
+    """Read the overdue report filters from the query string"""
+    return {
+        'user_id': request.args.get('user_id', type=int),
+        'min_days': request.args.get('min_days_overdue', type=int),
+        'max_days': request.args.get('max_days_overdue', type=int),
+    }
+
+def overdue_pagination():
+    """Return ``(page, per_page)`` for the JSON overdue report"""
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', current_app.config['OVERDUE_PER_PAGE'], type=int)
+    return max(page, 1), min(max(per_page, 1), 1000)
+
+def paginate(stmt, page, per_page):
+    # Fetch one extra row to find out whether another page follows
+    return stmt.limit(per_page + 1).offset((page - 1) * per_page)
+
+def overdue_page(rows, now, page, per_page):
+    """Respond with one page of the report, linking to the next if there is one"""
+    response = jsonify([overdue_row(c, now) for c in rows[:per_page]])
+    if len(rows) > per_page:
+        args = {**request.args.to_dict(), 'page': page + 1}
+        response.headers['Link'] = f'<{url_for(request.endpoint, **args)}>; rel="next"'
+    return response
 
 @bp.route('/overdue', methods=['GET'])
 def get_overdue_books():
-    """Get all overdue books"""
-    overdue_checkouts = Checkout.query.filter(
-        Checkout.return_date.is_(None),
-        Checkout.due_date < datetime.utcnow()
+    """Get overdue books.
+    
+    JSON is paginated; NDJSON and CSV stream every matching row.
+    """
+    output_format = request.args.get('format', 'json').lower()
+    if output_format not in ('json', 'ndjson', 'csv'):
+        return jsonify({"error": "format must be one of json, ndjson, csv"}), 400
+    
+    now = datetime.utcnow()
+    stmt = overdue_statement(now, **overdue_filters())
+    
+    # Streamed formats read the result through a server-side cursor in
+    # batches, so memory use does not grow with the size of the report
+    if output_format == 'ndjson':
+        rows = db.session.execute(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        return Response(stream_with_context(stream_overdue_ndjson(rows, now)),
+                        mimetype='application/x-ndjson')
+    if output_format == 'csv':
+        rows = db.session.execute(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        return Response(stream_with_context(stream_overdue_csv(rows, now)),
+                        mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=overdue.csv'})
+    
+    page, per_page = overdue_pagination()
+    rows = db.session.execute(paginate(stmt, page, per_page)).all()
+    return overdue_page(rows, now, page, per_page)
+
+
+@bp.route('/stats', methods=['GET'])
+def get_stats():
+    """Get circulation statistics from the rollup tables.
+    
+    Totals are a sum over a fixed number of rows and the top lists are
+    index scans of ``limit`` rows, however many checkouts there are.
+    """
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    
+    totals = db.session.execute(select(
+        func.coalesce(func.sum(CirculationTotals.loans), 0).label('loans'),
+        func.coalesce(func.sum(CirculationTotals.active_loans), 0).label('active_loans')
+    )).one()
+    
+    books = db.session.execute(
+        book_stats_statement()
+        .order_by(BookStats.loans.desc(), BookStats.book_id.desc()).limit(limit)
+    ).all()
+    users = db.session.execute(
+        user_stats_statement()
+        .order_by(UserStats.loans.desc(), UserStats.user_id.desc()).limit(limit)
     ).all()
     
-    return jsonify([{
-        'checkout_id': c.id,
-        'book_id': c.book_id,
-        'book_title': c.book.title if c.book else 'Unknown Book',
-        'user_id': c.user_id,
-        'checkout_date': c.checkout_date.isoformat(),
-        'due_date': c.due_date.isoformat(),
-        'days_overdue': (datetime.utcnow().date() - c.due_date.date()).days
-    } for c in overdue_checkouts]), 200
+    stats = {
+        'total_loans': totals.loans,
+        'active_loans': totals.active_loans,
+        'most_borrowed': [book_stats_row(b) for b in books],
+        'top_borrowers': [user_stats_row(u) for u in users],
+    }
+    
+    # Single title or user lookups are a primary key read each
+    book_id = request.args.get('book_id', type=int)
+    if book_id is not None:
+        book = db.session.execute(book_stats_statement().where(
+            BookStats.book_id == book_id)).first()
+        stats['book'] = book_stats_row(book) if book else None
+    user_id = request.args.get('user_id', type=int)
+    if user_id is not None:
+        user = db.session.execute(user_stats_statement().where(
+            UserStats.user_id == user_id)).first()
+        stats['user'] = user_stats_row(user) if user else None
+    
+    return jsonify(stats), 200
+
+def book_stats_statement():
+    return select(BookStats.book_id, Book.title, Book.total_copies,
+                  BookStats.loans, BookStats.active_loans).join(
+        Book, Book.id == BookStats.book_id)
+
+def book_stats_row(b):
+    return {
+        'book_id': b.book_id,
+        'title': b.title,
+        'loans': b.loans,
+        'active_loans': b.active_loans,
+        'total_copies': b.total_copies,
+        # Share of the title's copies currently on loan
+        'utilization': round(b.active_loans / b.total_copies, 4) if b.total_copies else None,
+    }
+
+def user_stats_statement():
+    return select(UserStats.user_id, User.name, UserStats.loans, UserStats.active_loans).join(
+        User, User.id == UserStats.user_id)
+
+def user_stats_row(u):
+    return {
+        'user_id': u.user_id,
+        'name': u.name,
+        'loans': u.loans,
+        'active_loans': u.active_loans,
+    }
@@ -0,0 +1,123 @@
+"""Circulation statistics kept in rollup tables.
+
+Checkouts and returns add to per-book and per-user counts and to the
+library-wide totals in the same transaction, and deleting a book takes its
+checkouts back out, so reading statistics never aggregates the checkouts
+table. ``flask library rebuild-stats`` recomputes
+everything from the checkouts, for backfills.
+"""
+from collections import defaultdict
+import click
+from sqlalchemy import case, delete, exists, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import BookStats, Checkout, CirculationTotals, UserStats, db
+from . import bp
+
+# Rows the library-wide totals are spread over
+TOTALS_SHARDS = 16
+
+
+def tally(checkouts=(), returns=()):
+    """Turn ``(book_id, user_id)`` pairs into ``{key: [loans, active_loans]}``
+    deltas per book, per user and per totals shard"""
+    books, users, shards = (defaultdict(lambda: [0, 0]) for _ in range(3))
+    for pairs, loans, active in ((checkouts, 1, 1), (returns, 0, -1)):
+        for book_id, user_id in pairs:
+            for counts, key in ((books, book_id), (users, user_id),
+                                (shards, book_id % TOTALS_SHARDS)):
+                counts[key][0] += loans
+                counts[key][1] += active
+    return books, users, shards
+
+
+def add_counts(model, key, deltas, dialect):
+    """Statements adding ``{key: [loans, active_loans]}`` deltas to a rollup
+    table, creating missing rows"""
+    table = model.__table__
+    column = table.c[key]
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = dialect_insert(table).values([
+            {key: value, 'loans': loans, 'active_loans': active}
+            for value, (loans, active) in deltas.items()
+        ])
+        return [stmt.on_conflict_do_update(index_elements=[column], set_={
+            'loans': table.c.loans + stmt.excluded.loans,
+            'active_loans': table.c.active_loans + stmt.excluded.active_loans,
+        })]
+
+    # Generic fallback: create missing rows, then add in one UPDATE
+    statements = [
+        insert(table).from_select(
+            [key, 'loans', 'active_loans'],
+            select(literal(value), literal(0), literal(0)).where(~exists().where(column == value))
+        )
+        for value in deltas
+    ]
+    loans = case({value: d[0] for value, d in deltas.items()}, value=column)
+    active = case({value: d[1] for value, d in deltas.items()}, value=column)
+    statements.append(
+        update(table).where(column.in_(deltas))
+        .values(loans=table.c.loans + loans, active_loans=table.c.active_loans + active)
+    )
+    return statements
+
+
+def stats_statements(dialect, checkouts=(), returns=()):
+    """Statements recording checkouts and returns, as ``(book_id, user_id)``
+    pairs, in the rollup tables"""
+    books, users, shards = tally(checkouts, returns)
+    statements = []
+    for model, key, deltas in ((BookStats, 'book_id', books), (UserStats, 'user_id', users),
+                               (CirculationTotals, 'shard', shards)):
+        if deltas:
+            statements += add_counts(model, key, deltas, dialect)
+    return statements
+
+
+def record_circulation(checkouts=(), returns=()):
+    """Record checkouts and returns in the current transaction"""
+    for stmt in stats_statements(db.engine.dialect.name, checkouts, returns):
+        db.session.execute(stmt)
+
+
+def forget_book(book_id):
+    """Take a book's checkouts out of the rollup tables in the current
+    transaction, before the book and its checkouts are deleted"""
+    active = func.sum(case((Checkout.return_date.is_(None), 1), else_=0))
+    per_user = db.session.execute(
+        select(Checkout.user_id, func.count(), active)
+        .where(Checkout.book_id == book_id).group_by(Checkout.user_id)
+    ).all()
+    db.session.execute(delete(BookStats).where(BookStats.book_id == book_id))
+    if not per_user:
+        return
+    users = {user_id: [-loans, -active] for user_id, loans, active in per_user}
+    shards = {book_id % TOTALS_SHARDS: [sum(d[0] for d in users.values()),
+                                        sum(d[1] for d in users.values())]}
+    dialect = db.engine.dialect.name
+    for model, key, deltas in ((UserStats, 'user_id', users),
+                               (CirculationTotals, 'shard', shards)):
+        for stmt in add_counts(model, key, deltas, dialect):
+            db.session.execute(stmt)
+
+
+def rebuild_stats():
+    """Recompute every rollup table from the checkouts and commit"""
+    active = func.sum(case((Checkout.return_date.is_(None), 1), else_=0))
+    for model, key, group in ((BookStats, 'book_id', Checkout.book_id),
+                              (UserStats, 'user_id', Checkout.user_id),
+                              (CirculationTotals, 'shard', Checkout.book_id % TOTALS_SHARDS)):
+        db.session.execute(delete(model))
+        db.session.execute(insert(model).from_select(
+            [key, 'loans', 'active_loans'],
+            select(group, func.count(), active).group_by(group)
+        ))
+    db.session.commit()
+
+
+@bp.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute circulation statistics from the checkouts."""
+    rebuild_stats()
+    click.echo('Circulation statistics rebuilt.')
@@ -0,0 +1,154 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import Response, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# [queries, database seconds] of the request being handled, if it is measured
+_request_db = ContextVar('request_db', default=None)
+
+# Upper bounds of the queries-per-request histogram
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_db.get() is not None:
+        conn.info['query_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counts = _request_db.get()
+    if counts is not None:
+        counts[0] += 1
+        counts[1] += time.perf_counter() - conn.info.pop('query_started', time.perf_counter())
+
+
+class Histogram:
+    """Cumulative-on-export histogram over fixed upper bounds"""
+
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+
+class Metrics:
+    """Per-endpoint request metrics of one app.
+
+    Recording a request is a dict lookup and a few additions under a lock,
+    so it is cheap enough to leave on in production.
+    """
+
+    def __init__(self, latency_buckets):
+        self.latency_buckets = tuple(latency_buckets)
+        self.lock = threading.Lock()
+        self.latency = {}  # (method, endpoint) -> Histogram of seconds
+        self.queries = {}  # (method, endpoint) -> Histogram of queries per request
+        self.db_seconds = {}  # (method, endpoint) -> seconds spent in the database
+        self.statuses = {}  # (method, endpoint, status) -> requests
+
+    def record(self, method, endpoint, status, seconds, queries, db_seconds):
+        key = (method, endpoint)
+        with self.lock:
+            latency = self.latency.get(key)
+            if latency is None:
+                latency = self.latency[key] = Histogram(self.latency_buckets)
+                self.queries[key] = Histogram(QUERY_BUCKETS)
+                self.db_seconds[key] = 0
+            latency.observe(seconds)
+            self.queries[key].observe(queries)
+            self.db_seconds[key] += db_seconds
+            status_key = (method, endpoint, status)
+            self.statuses[status_key] = self.statuses.get(status_key, 0) + 1
+
+    def render(self):
+        """The metrics in Prometheus text exposition format"""
+        with self.lock:
+            lines = [
+                '# HELP http_requests_total Requests handled, by endpoint and status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (method, endpoint, status), count in sorted(self.statuses.items()):
+                lines.append(f'http_requests_total{{method="{method}",endpoint="{endpoint}",'
+                             f'status="{status}"}} {count}')
+            for name, kind, help_text, values in (
+                ('http_request_duration_seconds', 'histogram',
+                 'Time to produce a response, by endpoint.', self.latency),
+                ('http_request_db_queries', 'histogram',
+                 'Database queries per request, by endpoint.', self.queries),
+                ('http_request_db_seconds_total', 'counter',
+                 'Time spent in database queries, by endpoint.', self.db_seconds),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                for (method, endpoint), value in sorted(values.items()):
+                    labels = f'method="{method}",endpoint="{endpoint}"'
+                    if kind == 'histogram':
+                        lines.extend(value.samples(name, labels))
+                    else:
+                        lines.append(f'{name}{{{labels}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def server_timing(seconds, queries, db_seconds):
+    """A Server-Timing header value for a request"""
+    return (f'app;dur={seconds * 1000:.2f}, '
+            f'db;dur={db_seconds * 1000:.2f};desc="{queries} queries"')
+
+
+def init_metrics(app):
+    """Record latency, status and database use of every request.
+
+    Served in Prometheus format at ``METRICS_PATH``. Requests that match no
+    route are recorded under the ``unmatched`` endpoint, so stray URLs
+    can't grow the label set.
+    """
+    if not app.config['METRICS_ENABLED']:
+        return
+    metrics = app.extensions['metrics'] = Metrics(app.config['METRICS_LATENCY_BUCKETS'])
+
+    # Engine-wide listeners also see the replica engines; they
+    # only count queries made while a measured request is active
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        _request_db.set([0, 0.0])
+
+    # Registered before the other response hooks, so it runs after them
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        counts = _request_db.get()
+        if started is None or counts is None:
+            return response
+        _request_db.set(None)
+        seconds = time.perf_counter() - started
+        queries, db_seconds = counts
+        metrics.record(request.method, request.endpoint or 'unmatched',
+                       response.status_code, seconds, queries, db_seconds)
+        if app.config['METRICS_SERVER_TIMING']:
+            response.headers['Server-Timing'] = server_timing(seconds, queries, db_seconds)
+        return response
+
+    @app.route(app.config['METRICS_PATH'], endpoint='metrics')
+    def export_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
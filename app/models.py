@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta
 from flask import current_app
 import jwt
-from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from app.hashing import get_password_hasher
+from app.search import attach_search_index
 
 class User(db.Model):
     """User model for authentication"""
@@ -24,10 +25,14 @@ class User(db.Model):
             self.set_password(kwargs['password'])
     
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = get_password_hasher().hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return get_password_hasher().verify(self.password, password)
+    
+    def password_needs_rehash(self):
+        """Whether the stored hash predates the configured hash parameters"""
+        return get_password_hasher().needs_rehash(self.password)
     
     def generate_auth_token(self):
         """Generate JWT token"""
@@ -66,7 +71,7 @@ class User(db.Model):
             'name': self.name,
             'email': self.email,
             'is_admin': self.is_admin,
-            'date_joined': self.date_joined.isoformat()
+            'date_joined': self.date_joined
         }
     
     def __repr__(self):
@@ -87,28 +92,41 @@ class Book(db.Model):
     total_copies = db.Column(db.Integer, default=1)
     available_copies = db.Column(db.Integer, default=1)
     date_added = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every UPDATE that does not set them itself; used for ETags
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1,
+                        onupdate=db.literal_column('version') + 1)
     
     # Relationships
     checkouts = db.relationship('Checkout', backref='book', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Serves the default listing order and keyset pagination
+        db.Index('ix_books_date_added_id', 'date_added', 'id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
             'title': self.title,
             'author': self.author,
             'isbn': self.isbn,
-            'published_date': self.published_date.isoformat() if self.published_date else None,
+            'published_date': self.published_date,
             'publisher': self.publisher,
             'description': self.description,
             'total_copies': self.total_copies,
             'available_copies': self.available_copies,
-            'date_added': self.date_added.isoformat()
+            'date_added': self.date_added,
+            'updated_at': self.updated_at
         }
     
     def __repr__(self):
         return f'<Book {self.title} by {self.author}>'
 
 
+attach_search_index(Book.__table__)
+
+
 class Checkout(db.Model):
     """Checkout model for tracking book checkouts"""
     __tablename__ = 'checkouts'
@@ -119,16 +137,76 @@ class Checkout(db.Model):
     checkout_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     due_date = db.Column(db.DateTime, nullable=False)
     return_date = db.Column(db.DateTime, nullable=True)
+    # Set by the overdue sweeper once the due date has passed, cleared on return
+    overdue = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    
+    __table_args__ = (
+        # Active-checkout indexes are partial where the backend supports it;
+        # elsewhere the leading return_date/extra columns keep them useful.
+        db.Index('ix_checkouts_active_book_user', 'book_id', 'user_id', 'return_date',
+                 sqlite_where=db.text('return_date IS NULL'),
+                 postgresql_where=db.text('return_date IS NULL')),
+        db.Index('ix_checkouts_user_checkout_date', 'user_id', 'checkout_date'),
+        # Open checkouts not yet flagged overdue: read by sweeps, and by the
+        # overdue report for those that became due since the last one
+        db.Index('ix_checkouts_unflagged_due_date', 'return_date', 'overdue', 'due_date',
+                 sqlite_where=db.text('return_date IS NULL AND overdue = 0'),
+                 postgresql_where=db.text('return_date IS NULL AND NOT overdue')),
+        # The small set of checkouts already flagged overdue, in report order
+        db.Index('ix_checkouts_overdue_due_date', 'due_date', 'id',
+                 sqlite_where=db.text('overdue = 1'),
+                 postgresql_where=db.text('overdue')),
+        db.Index('ix_checkouts_overdue_user', 'user_id', 'due_date', 'id',
+                 sqlite_where=db.text('overdue = 1'),
+                 postgresql_where=db.text('overdue')),
+    )
     
     def to_dict(self):
         return {
             'id': self.id,
             'book_id': self.book_id,
             'user_id': self.user_id,
-            'checkout_date': self.checkout_date.isoformat(),
-            'due_date': self.due_date.isoformat(),
-            'return_date': self.return_date.isoformat() if self.return_date else None
+            'checkout_date': self.checkout_date,
+            'due_date': self.due_date,
+            'return_date': self.return_date
         }
     
     def __repr__(self):
         return f'<Checkout {self.book_id} by user {self.user_id}>'
+
+
+class BookStats(db.Model):
+    """Running circulation counts for a book, kept up to date by checkouts and returns"""
+    __tablename__ = 'book_stats'
+    
+    book_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    loans = db.Column(db.Integer, nullable=False, default=0)
+    active_loans = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # Most borrowed titles are read straight off this index
+        db.Index('ix_book_stats_loans', 'loans', 'book_id'),
+    )
+
+
+class UserStats(db.Model):
+    """Running circulation counts for a user, kept up to date by checkouts and returns"""
+    __tablename__ = 'user_stats'
+    
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    loans = db.Column(db.Integer, nullable=False, default=0)
+    active_loans = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_user_stats_loans', 'loans', 'user_id'),
+    )
+
+
+class CirculationTotals(db.Model):
+    """Library-wide circulation counts, split over a few rows so concurrent
+    checkouts of different books don't all update the same one"""
+    __tablename__ = 'circulation_totals'
+    
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    loans = db.Column(db.Integer, nullable=False, default=0)
+    active_loans = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,128 @@
+"""Query profiling for development and tests.
+
+While a request is profiled, every statement it sends is counted by its
+SQL text. A statement repeating more than ``QUERY_REPEAT_THRESHOLD`` times
+is almost always a lazy load or lookup inside a loop (an N+1), and is
+logged or, with ``QUERY_REPEAT_ACTION = 'raise'``, fails the request at the
+offending query. Queries slower than ``QUERY_SLOW_MS`` are logged with
+their plan.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_profile = ContextVar('query_profile', default=None)
+
+# How each backend is asked for a plan
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+
+class RepeatedQueryError(Exception):
+    """Raised when a profiled block repeats a statement too often"""
+
+
+class QueryProfile:
+    """Statement counts of one profiled block"""
+
+    def __init__(self, logger, repeat_threshold, action='warn', slow_ms=None):
+        self.logger = logger
+        self.repeat_threshold = repeat_threshold
+        self.action = action
+        self.slow_seconds = slow_ms / 1000 if slow_ms else None
+        self.counts = {}
+
+    def count(self, statement):
+        count = self.counts[statement] = self.counts.get(statement, 0) + 1
+        if count == self.repeat_threshold + 1:
+            message = (f'Statement repeated more than {self.repeat_threshold} times, '
+                       f'likely an N+1 query: {statement}')
+            if self.action == 'raise':
+                raise RepeatedQueryError(message)
+            self.logger.warning(message)
+
+    def check_duration(self, conn, cursor, statement, parameters, seconds):
+        if self.slow_seconds is None or seconds < self.slow_seconds:
+            return
+        self.logger.warning('Slow query (%.1f ms): %s\n%s', seconds * 1000, statement,
+                            explain(conn, cursor, statement, parameters))
+
+
+def explain(conn, cursor, statement, parameters):
+    """The plan of a SELECT statement, as text, or a note why there isn't one"""
+    prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+    if prefix is None or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return 'No plan available'
+    # Run on a cursor of its own, outside SQLAlchemy, so it isn't profiled itself
+    plan_cursor = cursor.connection.cursor()
+    try:
+        plan_cursor.execute(prefix + statement, parameters)
+        return '\n'.join(' '.join(str(column) for column in row)
+                         for row in plan_cursor.fetchall())
+    except Exception as e:
+        return f'No plan available: {e}'
+    finally:
+        plan_cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _profile.get()
+    if profile is None:
+        return
+    # executemany() batches are one round trip, whatever their length
+    if not executemany:
+        profile.count(statement)
+    conn.info['profile_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _profile.get()
+    started = conn.info.pop('profile_started', None)
+    if profile is not None and started is not None:
+        profile.check_duration(conn, cursor, statement, parameters,
+                               time.perf_counter() - started)
+
+
+def _listen():
+    # Engine-wide, so replica engines are profiled too
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+@contextmanager
+def profile_queries(logger, repeat_threshold, action='warn', slow_ms=None):
+    """Profile the statements sent while the block runs; yields the
+    :class:`QueryProfile`"""
+    _listen()
+    profile = QueryProfile(logger, repeat_threshold, action, slow_ms)
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+def init_profiling(app):
+    """Profile every request's queries when ``QUERY_PROFILING`` is on"""
+    if not app.config['QUERY_PROFILING']:
+        return
+    _listen()
+
+    @app.before_request
+    def start_profile():
+        g.query_profile_token = _profile.set(QueryProfile(
+            app.logger, app.config['QUERY_REPEAT_THRESHOLD'],
+            app.config['QUERY_REPEAT_ACTION'], app.config['QUERY_SLOW_MS']))
+
+    @app.teardown_request
+    def end_profile(exc):
+        token = g.pop('query_profile_token', None)
+        if token is not None:
+            _profile.reset(token)
@@ -0,0 +1,24 @@
+"""Schema instances shared by the blueprints.
+
+They are built on first use, so marshmallow isn't imported until a request
+needs to validate input.
+"""
+from functools import cache
+
+
+@cache
+def book_schema():
+    from app.books.schemas import BookSchema
+    return BookSchema()
+
+
+@cache
+def bulk_books_schema():
+    from app.books.schemas import BookSchema
+    return BookSchema(many=True)
+
+
+@cache
+def checkout_schema():
+    from app.books.schemas import CheckoutSchema
+    return CheckoutSchema()
@@ -0,0 +1,136 @@
+"""Full-text search over the book catalog.
+
+SQLite databases get an external-content FTS5 table (``books_fts``) kept in
+sync with ``books`` by triggers; PostgreSQL gets a GIN index over a
+``to_tsvector`` expression. Any other backend falls back to ILIKE matching.
+"""
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import DDL, Integer, column, event, literal_column, or_, table, text
+
+# Columns covered by the search index. ISBN is included so that searching
+# by ISBN keeps working as it did with the old ILIKE filter.
+SEARCH_COLUMNS = ('title', 'author', 'publisher', 'description', 'isbn')
+
+FTS_TABLE = 'books_fts'
+
+_cols = ', '.join(SEARCH_COLUMNS)
+_new_cols = ', '.join(f'new.{c}' for c in SEARCH_COLUMNS)
+_old_cols = ', '.join(f'old.{c}' for c in SEARCH_COLUMNS)
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"{_cols}, content='books', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new_cols}); END",
+    f"CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) "
+    f"VALUES ('delete', old.id, {_old_cols}); END",
+    # Only re-index when a searchable column changes, so checkouts and
+    # returns (which touch available_copies) never churn the index.
+    f"CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF {_cols} ON books BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_cols}) "
+    f"VALUES ('delete', old.id, {_old_cols}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_cols}) VALUES (new.id, {_new_cols}); END",
+]
+
+SQLITE_DROP_DDL = [
+    "DROP TRIGGER IF EXISTS books_fts_au",
+    "DROP TRIGGER IF EXISTS books_fts_ad",
+    "DROP TRIGGER IF EXISTS books_fts_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# The query must use exactly this expression for PostgreSQL to pick the index.
+PG_TSVECTOR = "to_tsvector('simple', " + " || ' ' || ".join(
+    f"coalesce(books.{c}, '')" for c in SEARCH_COLUMNS) + ")"
+
+PG_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_books_search ON books USING GIN ({PG_TSVECTOR})",
+]
+
+PG_DROP_DDL = [
+    "DROP INDEX IF EXISTS ix_books_search",
+]
+
+_fts = table(FTS_TABLE, column('rowid', Integer), column('rank'))
+
+
+def attach_search_index(books_table):
+    """Create and drop the search index alongside the ``books`` table."""
+    for statement in SQLITE_DDL:
+        event.listen(books_table, 'after_create',
+                     DDL(statement).execute_if(dialect='sqlite'))
+    for statement in PG_DDL:
+        event.listen(books_table, 'after_create',
+                     DDL(statement).execute_if(dialect='postgresql'))
+    for statement in SQLITE_DROP_DDL:
+        event.listen(books_table, 'before_drop',
+                     DDL(statement).execute_if(dialect='sqlite'))
+    for statement in PG_DROP_DDL:
+        event.listen(books_table, 'before_drop',
+                     DDL(statement).execute_if(dialect='postgresql'))
+
+
+@contextmanager
+def suspend_search_index(session):
+    """Skip per-row search indexing for a bulk load into ``books``, then
+    index everything in one pass at the end.
+
+    On SQLite the insert trigger is dropped for the block and the FTS table
+    rebuilt afterwards; other backends index as they go.
+    """
+    if session.get_bind().dialect.name != 'sqlite':
+        yield
+        return
+    session.execute(text("DROP TRIGGER IF EXISTS books_fts_ai"))
+    try:
+        yield
+    finally:
+        session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        session.execute(text(SQLITE_DDL[1]))
+
+
+def search_terms(search):
+    """Split a user-supplied search string into lowercase word tokens"""
+    return re.findall(r'\w+', search.lower())
+
+
+def apply_search(query, model, search, dialect, rank=True):
+    """Filter ``query`` to books matching ``search``, best matches first.
+
+    Every token must match the start of a word in one of the indexed
+    columns, so ``"gats fitz"`` finds *The Great Gatsby* by Fitzgerald.
+    Pass ``rank=False`` to filter without imposing relevance ordering.
+    """
+    terms = search_terms(search)
+    if not terms:
+        return query
+
+    if dialect == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        query = query.join(_fts, _fts.c.rowid == model.id).filter(
+            literal_column(FTS_TABLE).op('MATCH')(match)
+        )
+        return query.order_by(_fts.c.rank) if rank else query
+
+    if dialect == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        query = query.filter(
+            text(f"{PG_TSVECTOR} @@ to_tsquery('simple', :tsquery)")
+        ).params(tsquery=tsquery)
+        if rank:
+            query = query.order_by(
+                text(f"ts_rank({PG_TSVECTOR}, to_tsquery('simple', :tsquery)) DESC")
+            )
+        return query
+
+    # No index available on this backend; fall back to substring matching.
+    for term in terms:
+        pattern = f'%{term}%'
+        query = query.filter(or_(
+            *(getattr(model, c).ilike(pattern) for c in SEARCH_COLUMNS)
+        ))
+    return query
@@ -0,0 +1,293 @@
+"""Deterministic synthetic data for local testing at production scale.
+
+``flask seed`` (see :mod:`app.cli`) fills an empty database with users,
+books and checkouts. The same ``--seed`` always produces the same data.
+Rows are generated as tuples already in the driver's storage format and
+written with driver-level ``executemany`` batches, skipping the ORM unit
+of work and SQLAlchemy's per-value processing, with secondary indexes
+built once at the end. Circulation statistics are counted while the
+checkouts are generated and written directly, instead of re-aggregating
+the checkouts afterwards.
+"""
+import collections
+import functools
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from sqlalchemy import bindparam, insert, update
+from app.library.stats import TOTALS_SHARDS
+from app.models import Book, BookStats, Checkout, CirculationTotals, User, UserStats, db
+from app.search import suspend_search_index
+
+# Every seeded user can log in with this password. Its hash is fixed rather
+# than derived on each run, which would cost as much as loading ~30k rows;
+# logins upgrade it if PASSWORD_HASH_METHOD asks for other parameters
+SEED_PASSWORD = 'password'
+SEED_PASSWORD_HASH = ('pbkdf2:sha256:600000$YXtutj94f0hdryud$'
+                      '5c10d129a74b805e3e30b7a0e42d19543dda32f4bf9e05a4c3b53e613c10ea1a')
+LOAN_DAYS = 14
+HISTORY_DAYS = 365
+
+FIRST_NAMES = ('Ada', 'Alan', 'Grace', 'Edsger', 'Barbara', 'Donald', 'Frances', 'Ken',
+               'Margaret', 'Dennis', 'Radia', 'Tim', 'Sophie', 'Niklaus', 'Karen', 'John')
+LAST_NAMES = ('Lovelace', 'Turing', 'Hopper', 'Dijkstra', 'Liskov', 'Knuth', 'Allen',
+              'Thompson', 'Hamilton', 'Ritchie', 'Perlman', 'Lee', 'Wilson', 'Wirth',
+              'Sparck', 'Backus', 'Morrison', 'Okafor', 'Tanaka', 'Silva')
+TITLE_WORDS = ('River', 'Shadow', 'Garden', 'Empire', 'Winter', 'Silver', 'Ocean', 'Forest',
+               'Stone', 'Light', 'Night', 'City', 'Storm', 'Fire', 'Glass', 'Crown', 'Memory',
+               'Engine', 'Harbor', 'Letters', 'Orchard', 'Signal', 'Tide', 'Wolves')
+PUBLISHERS = ('Northwind Press', 'Harbor House', 'Blue Fern Books', 'Meridian',
+              'Lantern & Co', 'Old Mill Publishing', 'Quarto Street')
+COPIES = (1, 1, 1, 2, 2, 3, 5)
+
+
+def _weighted_digit_sums(weights):
+    # Weighted digit sums of every three-digit group, for the ISBN check digit
+    return [sum(int(d) * w for d, w in zip(f'{n:03d}', weights)) for n in range(1000)]
+
+
+_ODD_GROUPS = _weighted_digit_sums((3, 1, 3))
+_EVEN_GROUPS = _weighted_digit_sums((1, 3, 1))
+_PREFIX_SUM = 9 + 7 * 3 + 8  # 978
+
+
+def isbn13(number):
+    """A valid ISBN-13 in the 978 range for ``number`` (below 10**9)"""
+    total = (_PREFIX_SUM + _ODD_GROUPS[number // 1_000_000]
+             + _EVEN_GROUPS[number // 1000 % 1000] + _ODD_GROUPS[number % 1000])
+    return f'978{number:09d}{-total % 10}'
+
+
+def zipf_weights(count, exponent):
+    """Cumulative weights of ``count`` ranks under Zipf's law"""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def value_adapters(dialect):
+    """Functions turning datetimes and dates into what the driver stores.
+
+    SQLite stores them as text, so they are formatted the way SQLAlchemy
+    formats them; other drivers take them as they are.
+    """
+    if dialect.name == 'sqlite':
+        return functools.partial(datetime.isoformat, sep=' ', timespec='microseconds'), \
+            date.isoformat
+    return (lambda d: d), (lambda d: d)
+
+
+USER_COLUMNS = ('name', 'email', 'password', 'is_admin', 'date_joined')
+
+
+def generate_users(rng, count, password_hash, now, stamp):
+    names = [f'{first} {last}' for first in FIRST_NAMES for last in LAST_NAMES]
+    span = 3 * HISTORY_DAYS * 86400
+    for user_id in range(1, count + 1):
+        yield (names[int(rng.random() * len(names))], f'user{user_id}@example.com',
+               password_hash, user_id == 1, stamp(now - timedelta(seconds=rng.random() * span)))
+
+
+BOOK_COLUMNS = ('title', 'author', 'isbn', 'published_date', 'publisher', 'description',
+                'total_copies', 'available_copies', 'date_added', 'updated_at', 'version')
+
+
+def generate_books(rng, count, copies, now, stamp, datestamp):
+    """Book rows; ``copies[id]`` gives each book's copies.
+
+    Books are added steadily over three years, in id order. Authors follow
+    a Zipf distribution, so a few are very prolific.
+    """
+    titles = [(f'The {a} of {b} {c}', f'A {b.lower()} novel about {c.lower()}.')
+              for a, b, c in itertools.permutations(TITLE_WORDS, 3)]
+    authors = [f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+               for _ in range(max(count // 8, 1))]
+    by_book = rng.choices(authors, cum_weights=zipf_weights(len(authors), 1.0), k=count)
+    # Published within the 40 years before the catalog was started
+    first_added = now - timedelta(days=3 * HISTORY_DAYS)
+    published = [datestamp((first_added - timedelta(days=day)).date())
+                 for day in range(40 * 365)]
+    step = timedelta(days=3 * HISTORY_DAYS) / max(count, 1)
+    for book_id, author in enumerate(by_book, 1):
+        title, description = titles[int(rng.random() * len(titles))]
+        added = stamp(first_added + step * book_id)
+        yield (title, author, isbn13(book_id), published[int(rng.random() * len(published))],
+               PUBLISHERS[int(rng.random() * len(PUBLISHERS))], description,
+               copies[book_id], copies[book_id], added, added, 1)
+
+
+CHECKOUT_COLUMNS = ('book_id', 'user_id', 'checkout_date', 'due_date', 'return_date', 'overdue')
+
+# Checkout times fall on this grid, so each timestamp is formatted only once
+CHECKOUT_STEP_MINUTES = 5
+
+
+class Circulation:
+    """Loans and open loans per book and per user, counted as checkouts
+    are generated"""
+
+    def __init__(self, books, users):
+        self.book_loans = collections.Counter()
+        self.book_active = bytearray(books + 1)  # Never more than a book's copies
+        self.user_loans = collections.Counter()
+        self.user_active = [0] * (users + 1)
+
+    def stats_rows(self):
+        """``(key, loans, active_loans)`` rows for the book, user and totals
+        rollup tables, as :func:`app.library.stats.rebuild_stats` would
+        compute them"""
+        books = [(book_id, loans, self.book_active[book_id])
+                 for book_id, loans in sorted(self.book_loans.items())]
+        users = [(user_id, loans, self.user_active[user_id])
+                 for user_id, loans in sorted(self.user_loans.items())]
+        shards = {}
+        for book_id, loans, active in books:
+            shard = shards.setdefault(book_id % TOTALS_SHARDS, [0, 0])
+            shard[0] += loans
+            shard[1] += active
+        return books, users, [(shard, *counts) for shard, counts in shards.items()]
+
+
+def generate_checkouts(rng, count, books, users, copies, circulation, now, stamp, batch_size):
+    """Checkout rows over the last ``HISTORY_DAYS``.
+
+    Books and users are drawn from Zipf distributions over shuffled ids, so
+    a few titles and readers account for most loans. Most loans that are
+    past due have been returned; the rest are flagged overdue. A loan is
+    only left open if the title has a copy free and the user doesn't
+    already hold it. Loans are counted in ``circulation``.
+    """
+    book_ids = list(range(1, books + 1))
+    user_ids = list(range(1, users + 1))
+    rng.shuffle(book_ids)
+    rng.shuffle(user_ids)
+    book_weights = zipf_weights(books, 0.8)
+    user_weights = zipf_weights(users, 0.5)
+    open_loans = set()
+    active, user_active = circulation.book_active, circulation.user_active
+    random = rng.random
+
+    # Slot n is n steps after the start of the history; ``history`` is now
+    step = timedelta(minutes=CHECKOUT_STEP_MINUTES)
+    history = HISTORY_DAYS * 24 * 60 // CHECKOUT_STEP_MINUTES
+    loan = LOAN_DAYS * 24 * 60 // CHECKOUT_STEP_MINUTES
+    grace = 7 * 24 * 60 // CHECKOUT_STEP_MINUTES
+    start = now - step * history
+    stamps = [stamp(start + step * slot) for slot in range(history + loan)]
+
+    for first in range(0, count, batch_size):
+        size = min(batch_size, count - first)
+        drawn_books = rng.choices(book_ids, cum_weights=book_weights, k=size)
+        drawn_users = rng.choices(user_ids, cum_weights=user_weights, k=size)
+        circulation.book_loans.update(drawn_books)
+        circulation.user_loans.update(drawn_users)
+        for book_id, user_id in zip(drawn_books, drawn_users):
+            slot = int(random() * history)
+            past_due = slot + loan < history
+            # 85% of past-due loans came back; 40% of current ones came back early
+            returned = random() < (0.85 if past_due else 0.4)
+            if not returned and (active[book_id] >= copies[book_id]
+                                 or (book_id, user_id) in open_loans):
+                returned = True
+            if returned:
+                latest = min(history, slot + loan + grace) - slot
+                return_date = stamps[slot + int(random() * latest)]
+            else:
+                return_date = None
+                active[book_id] += 1
+                user_active[user_id] += 1
+                open_loans.add((book_id, user_id))
+            yield (book_id, user_id, stamps[slot], stamps[slot + loan], return_date,
+                   return_date is None and past_due)
+
+
+def insert_batches(table, columns, rows, batch_size):
+    """Insert ``rows``, tuples of ``columns``, with one driver-level
+    executemany per batch; returns the row count"""
+    stmt = insert(table).values({c: bindparam(c) for c in columns})
+    return execute_batches(stmt, columns, rows, batch_size)
+
+
+def execute_batches(stmt, columns, rows, batch_size):
+    """Run ``stmt`` for ``rows``, tuples of values for its ``columns`` bind
+    parameters, with one driver-level executemany per batch; returns the
+    row count.
+
+    Values go to the driver as they are, skipping SQLAlchemy's per-value
+    processing, so they must already be in the form the driver stores.
+    """
+    connection = db.session.connection()
+    compiled = stmt.compile(dialect=connection.dialect)
+    sql = str(compiled)
+    if compiled.positional:
+        order = [columns.index(name) for name in compiled.positiontup]
+        if order != list(range(len(columns))):
+            rows = (tuple(row[i] for i in order) for row in rows)
+    else:
+        rows = (dict(zip(columns, row)) for row in rows)
+
+    inserted = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return inserted
+        connection.exec_driver_sql(sql, batch)
+        inserted += len(batch)
+
+
+@contextmanager
+def deferred_indexes(table):
+    """Drop the secondary indexes of ``table`` for a bulk load and build
+    them again afterwards, which is much faster than maintaining them
+    row by row"""
+    connection = db.session.connection()
+    for index in table.indexes:
+        index.drop(connection)
+    try:
+        yield
+    finally:
+        for index in table.indexes:
+            index.create(connection)
+
+
+def seed_database(books, users, checkouts, seed=0, batch_size=50_000, now=None):
+    """Fill an empty database with synthetic data and commit.
+
+    Returns ``{table: rows}`` for the rows inserted.
+    """
+    now = now or datetime.utcnow()
+    rng = random.Random(seed)
+    stamp, datestamp = value_adapters(db.session.get_bind().dialect)
+    copies = bytearray([0]) + bytearray(rng.choices(COPIES, k=books))
+    circulation = Circulation(books, users)
+
+    counts = {}
+    counts['users'] = insert_batches(
+        User.__table__, USER_COLUMNS,
+        generate_users(rng, users, SEED_PASSWORD_HASH, now, stamp), batch_size)
+    with suspend_search_index(db.session), deferred_indexes(Book.__table__):
+        counts['books'] = insert_batches(
+            Book.__table__, BOOK_COLUMNS,
+            generate_books(rng, books, copies, now, stamp, datestamp), batch_size)
+    with deferred_indexes(Checkout.__table__):
+        counts['checkouts'] = insert_batches(
+            Checkout.__table__, CHECKOUT_COLUMNS,
+            generate_checkouts(rng, checkouts, books, users, copies, circulation, now, stamp,
+                               batch_size), batch_size)
+
+    for model, rows in zip((BookStats, UserStats, CirculationTotals),
+                           circulation.stats_rows()):
+        insert_batches(model.__table__, tuple(model.__table__.columns.keys()), iter(rows),
+                       batch_size)
+
+    # Open loans hold copies; setting updated_at and version to themselves
+    # keeps their onupdate defaults out of the statement
+    books_table = Book.__table__
+    held = ((copies[book_id] - count, book_id)
+            for book_id, count in enumerate(circulation.book_active) if count)
+    execute_batches(
+        update(books_table).where(books_table.c.id == bindparam('b_id')).values(
+            available_copies=bindparam('available'), updated_at=books_table.c.updated_at,
+            version=books_table.c.version),
+        ('available', 'b_id'), held, batch_size)
+    db.session.commit()
+    return counts
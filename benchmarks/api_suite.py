@@ -0,0 +1,245 @@
+"""Latency and throughput of the main API operations on seeded datasets.
+
+    python -m benchmarks.api_suite run [--scale 10k] [--clients 8] [--requests 500]
+                                       [--output results.json]
+    python -m benchmarks.api_suite compare baseline.json results.json [--tolerance 10]
+
+``run`` seeds (once, then reuses) a SQLite database of the chosen scale and
+measures search, paginated listing, get-by-id, checkout/return cycles and
+overdue report pages, first from a single client and then from
+``--clients`` concurrent ones. Caches are off, so every request reaches the
+database. Results are printed and, with ``--output``, written as JSON.
+
+``compare`` lines up two result files and flags any operation whose p95
+latency grew, or whose throughput dropped, by more than ``--tolerance``
+percent; it exits with status 1 when there is a regression.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app import create_app, db
+from app.models import Book
+from app.seed import TITLE_WORDS, seed_database
+
+# Books at each scale; users and checkouts grow with them
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+USERS_PER_BOOK = 0.1
+CHECKOUTS_PER_BOOK = 2
+
+# Search for words that seeded titles are made of
+WORDS = tuple(word.lower() for word in TITLE_WORDS)
+
+
+def seed(database_uri, books):
+    """Fill an empty database with ``books`` books and matching users and checkouts"""
+    app = make_app(database_uri)
+    with app.app_context():
+        db.create_all()
+        seed_database(books=books, users=int(books * USERS_PER_BOOK),
+                      checkouts=books * CHECKOUTS_PER_BOOK)
+        db.engine.dispose()
+
+
+def make_app(database_uri):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'BOOK_CACHE_TTL': 0,
+        'BOOK_TOTALS_CACHE_TTL': 0,
+        'USER_CACHE_TTL': 0,
+        'QUERY_PROFILING': False,
+    })
+
+
+def operations(books, users, free_books):
+    """Map each operation to a function making one request with a client.
+
+    Each gets the client and a counter unique to the calling thread, so
+    concurrent checkouts never collide on a (book, user) pair. Checkouts
+    only take ``free_books``, titles nobody has on loan.
+    """
+    due_date = (datetime.utcnow() + timedelta(days=14)).isoformat()
+
+    def search(client, n):
+        return [client.get('/api/books', query_string={
+            'search': WORDS[n % len(WORDS)], 'page': n % 5 + 1, 'with_total': 'false'})]
+
+    def listing(client, n):
+        return [client.get('/api/books', query_string={'page': n % 200 + 1})]
+
+    def get_by_id(client, n):
+        return [client.get(f'/api/books/{n * 7919 % books + 1}')]
+
+    def checkout_return(client, n):
+        response = client.post('/api/library/checkout', json={
+            'book_id': free_books[n * 7919 % len(free_books)], 'user_id': n % users + 1,
+            'due_date': due_date})
+        if response.status_code != 200:
+            return [response]
+        checkout_id = response.get_json()['checkout_id']
+        return [response, client.post(f'/api/library/return/{checkout_id}')]
+
+    def overdue(client, n):
+        return [client.get('/api/library/overdue', query_string={'page': n % 10 + 1})]
+
+    return {'search': search, 'listing': listing, 'get_by_id': get_by_id,
+            'checkout_return': checkout_return, 'overdue': overdue}
+
+
+def measure(app, operation, clients, requests):
+    """Run ``requests`` operations spread over ``clients`` threads"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index):
+        client = app.test_client()
+        mine, failed = [], 0
+        for i in range(requests // clients):
+            started = time.perf_counter()
+            responses = operation(client, index + i * clients)
+            mine.append(time.perf_counter() - started)
+            failed += any(r.status_code >= 400 for r in responses)
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'req_per_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(quantiles[49] * 1000, 2),
+        'p95_ms': round(quantiles[94] * 1000, 2),
+        'p99_ms': round(quantiles[98] * 1000, 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    books = SCALES[args.scale]
+    users = int(books * USERS_PER_BOOK)
+    path = os.path.join(args.data_dir, f'library-{args.scale}.db')
+    database_uri = f'sqlite:///{path}'
+    if not os.path.exists(path):
+        os.makedirs(args.data_dir, exist_ok=True)
+        print(f'Seeding {books} books into {path}...', flush=True)
+        started = time.perf_counter()
+        seed(database_uri, books)
+        print(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+    app = make_app(database_uri)
+    with app.app_context():
+        free_books = db.session.scalars(
+            select(Book.id).where(Book.available_copies == Book.total_copies)).all()
+    results = {}
+    print(f"{'operation':<16} {'clients':>7} {'req/s':>8} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, operation in operations(books, users, free_books).items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = {}
+        for mode, clients in (('single', 1), ('concurrent', args.clients)):
+            result = results[name][mode] = measure(app, operation, clients, args.requests)
+            print(f"{name:<16} {clients:>7} {result['req_per_s']:>8.1f} {result['p50_ms']:>8.2f} "
+                  f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>7}")
+
+    if args.output:
+        report = {
+            'meta': {
+                'scale': args.scale, 'books': books, 'users': users,
+                'checkouts': books * CHECKOUTS_PER_BOOK, 'clients': args.clients,
+                'requests': args.requests, 'revision': git_revision(),
+                'python': platform.python_version(),
+                'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Wrote {args.output}')
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline['meta']['scale'] != current['meta']['scale']:
+        print('Warning: comparing runs at different scales')
+
+    regressions = 0
+    print(f"{'operation':<16} {'mode':<10} {'p95 ms':>17} {'change':>8} "
+          f"{'req/s':>17} {'change':>8}")
+    for name, modes in current['results'].items():
+        for mode, result in modes.items():
+            before = baseline['results'].get(name, {}).get(mode)
+            if before is None:
+                continue
+            p95_change = (result['p95_ms'] / before['p95_ms'] - 1) * 100
+            rate_change = (result['req_per_s'] / before['req_per_s'] - 1) * 100
+            regressed = p95_change > args.tolerance or rate_change < -args.tolerance
+            regressions += regressed
+            print(f"{name:<16} {mode:<10} {before['p95_ms']:>8.2f}>{result['p95_ms']:<8.2f} "
+                  f"{p95_change:>+7.1f}% {before['req_per_s']:>8.1f}>{result['req_per_s']:<8.1f} "
+                  f"{rate_change:>+7.1f}%{'  REGRESSION' if regressed else ''}")
+    print(f'{regressions} regression(s) beyond {args.tolerance}%')
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Benchmark one dataset scale')
+    run_parser.add_argument('--scale', choices=SCALES, default='10k')
+    run_parser.add_argument('--clients', type=int, default=8)
+    run_parser.add_argument('--requests', type=int, default=500,
+                            help='Requests per operation and mode')
+    run_parser.add_argument('--only', nargs='+', metavar='OPERATION',
+                            help='Benchmark just these operations')
+    run_parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(),
+                                                               'library-benchmarks'),
+                            help='Where seeded databases are kept between runs')
+    run_parser.add_argument('--output', help='Write the results to this JSON file')
+
+    compare_parser = commands.add_parser('compare', help='Flag regressions between two runs')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=10,
+                                help='Percent change allowed before flagging')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Compare concurrent read/write throughput on SQLite with and without the
+engine tuning in ``SQLITE_PRAGMAS``.
+
+    python -m benchmarks.db_concurrency [--readers 8] [--writers 2] [--duration 5]
+
+Readers fetch single books and listing pages while writers update books.
+The baseline runs SQLite's defaults: a rollback journal, so a writer locks
+readers out, and a full fsync on every commit.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from app import create_app, db
+from app.models import Book
+
+BOOKS = 1000
+
+
+def make_app(database_uri, pragmas):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'SQLITE_PRAGMAS': pragmas,
+        'BOOK_CACHE_TTL': 0,
+        'BOOK_TOTALS_CACHE_TTL': 0,
+        'QUERY_PROFILING': False,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(Book(title=f'Book {i}', author=f'Author {i % 40}',
+                                isbn=f'{9780000000000 + i}', total_copies=2,
+                                available_copies=2) for i in range(BOOKS))
+        db.session.commit()
+    return app
+
+
+def run(app, readers, writers, duration):
+    """Return completed/failed request counts per kind"""
+    stop = threading.Event()
+    counts = Counter()
+
+    def reader(offset):
+        client = app.test_client()
+        n = offset
+        while not stop.is_set():
+            n += 1
+            if n % 4:
+                response = client.get(f'/api/books/{n % BOOKS + 1}')
+            else:
+                response = client.get(f'/api/books?page={n % 50 + 1}')
+            counts['reads' if response.status_code == 200 else 'read errors'] += 1
+
+    def writer(offset):
+        client = app.test_client()
+        n = offset
+        while not stop.is_set():
+            n += 1
+            response = client.put(f'/api/books/{n % BOOKS + 1}',
+                                  json={'description': f'Revision {n}'})
+            counts['writes' if response.status_code == 200 else 'write errors'] += 1
+
+    threads = [threading.Thread(target=reader, args=(i * 97,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i * 89,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5)
+    args = parser.parse_args()
+
+    tuned = create_app({}).config['SQLITE_PRAGMAS']
+    setups = [('sqlite defaults', {}), ('tuned pragmas', tuned)]
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.duration:g}s each')
+    print(f"{'setup':<16} {'reads/s':>9} {'writes/s':>9} {'errors':>7}")
+    for name, pragmas in setups:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app('sqlite:///' + os.path.join(tmp, 'library.db'), pragmas)
+            counts = run(app, args.readers, args.writers, args.duration)
+            with app.app_context():
+                db.engine.dispose()
+        errors = counts['read errors'] + counts['write errors']
+        print(f"{name:<16} {counts['reads'] / args.duration:>9.1f} "
+              f"{counts['writes'] / args.duration:>9.1f} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Measure catalog-read latency while a flood of logins hits the server.
+
+    python -m benchmarks.login_flood [--server-threads 8] [--login-clients 32]
+
+The server is modelled as a fixed pool of request threads, like a threaded
+WSGI server. One client reads single books in a loop while many clients log
+in back to back. With inline hashing every server thread ends up inside the
+KDF and reads queue behind the logins; with the hashing pool, logins past
+``PASSWORD_HASH_MAX_PENDING`` are turned away with a 503 and reads keep
+their latency.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from app import create_app, db
+from app.models import Book, User
+from config import Config
+
+PASSWORD = 'flood-password'
+
+
+def make_app(database_uri, workers, max_pending, method):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'PASSWORD_HASH_METHOD': method,
+        'PASSWORD_HASH_WORKERS': workers,
+        'PASSWORD_HASH_MAX_PENDING': max_pending,
+        'BOOK_CACHE_TTL': 0,
+        'QUERY_PROFILING': False,
+    })
+    with app.app_context():
+        db.create_all()
+        if not db.session.get(User, 1):
+            db.session.add(User(name='Flood', email='flood@example.com', password=PASSWORD))
+            db.session.add_all(Book(title=f'Book {i}', author='Author', isbn=f'{9780000000000 + i}',
+                                    total_copies=1, available_copies=1) for i in range(100))
+            db.session.commit()
+    return app
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def run(app, server_threads, login_clients, duration):
+    """Return read latencies (ms) and login status counts for one run"""
+    server = ThreadPoolExecutor(max_workers=server_threads)
+    stop = threading.Event()
+    reads, logins = [], Counter()
+
+    def handle(method, path, **kwargs):
+        return getattr(app.test_client(), method)(path, **kwargs)
+
+    def reader():
+        book_id = 0
+        while not stop.is_set():
+            book_id = book_id % 100 + 1
+            started = time.perf_counter()
+            server.submit(handle, 'get', f'/api/books/{book_id}').result()
+            reads.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.01)
+
+    def login_client():
+        while not stop.is_set():
+            response = server.submit(handle, 'post', '/api/auth/login', json={
+                'email': 'flood@example.com', 'password': PASSWORD}).result()
+            logins[response.status_code] += 1
+            if response.status_code == 503:
+                time.sleep(0.05)  # Back off, scaled down from Retry-After
+
+    threads = [threading.Thread(target=reader)]
+    threads += [threading.Thread(target=login_client) for _ in range(login_clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+    return reads, logins
+
+
+def report(name, reads, logins):
+    logins = ', '.join(f'{count}x {status}' for status, count in sorted(logins.items())) or '-'
+    print(f'{name:<22} {len(reads):>6} {statistics.median(reads):>8.1f} '
+          f'{percentile(reads, 95):>8.1f} {max(reads):>8.1f}   {logins}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server-threads', type=int, default=8)
+    parser.add_argument('--login-clients', type=int, default=32)
+    parser.add_argument('--hash-workers', type=int, default=Config.PASSWORD_HASH_WORKERS)
+    parser.add_argument('--max-pending', type=int, default=Config.PASSWORD_HASH_MAX_PENDING)
+    parser.add_argument('--method', default='pbkdf2:sha256:600000')
+    parser.add_argument('--duration', type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_uri = 'sqlite:///' + os.path.join(tmp, 'flood.db')
+        setups = [
+            ('inline, no flood', 0, None, 0),
+            ('inline hashing', 0, None, args.login_clients),
+            ('hashing pool', args.hash_workers, args.max_pending, args.login_clients),
+        ]
+        print(f'{args.server_threads} server threads, {args.login_clients} login clients, '
+              f'{args.method}')
+        print(f"{'setup':<22} {'reads':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}   logins")
+        for name, workers, max_pending, login_clients in setups:
+            app = make_app(database_uri, workers, max_pending, args.method)
+            reads, logins = run(app, args.server_threads, login_clients, args.duration)
+            app.extensions['password_hasher'].shutdown()
+            report(name, reads, logins)
+
+
+if __name__ == '__main__':
+    main()
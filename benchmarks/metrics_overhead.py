@@ -0,0 +1,78 @@
+"""Measure the cost of request metrics.
+
+    python -m benchmarks.metrics_overhead [--requests 5000] [--queries 20000]
+
+Times a cheap endpoint (a cached single book, so almost nothing but the
+request cycle is measured) with ``METRICS_ENABLED`` off and on, and the
+query listeners on their own by running ``SELECT 1`` with and without a
+measured request active.
+"""
+import argparse
+import time
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.metrics import _request_db
+from app.models import Book
+
+
+def make_app(enabled):
+    app = create_app({'METRICS_ENABLED': enabled, 'METRICS_SERVER_TIMING': enabled,
+                      'QUERY_PROFILING': False})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Book(title='Bench', author='Author', isbn='9780000000003',
+                            total_copies=1, available_copies=1))
+        db.session.commit()
+    return app
+
+
+def time_requests(app, count):
+    client = app.test_client()
+    client.get('/api/books/1')  # Fill the book cache
+    started = time.perf_counter()
+    for _ in range(count):
+        client.get('/api/books/1')
+    return (time.perf_counter() - started) / count
+
+
+def time_queries(app, count, measured):
+    with app.app_context():
+        connection = db.session.connection()
+        token = _request_db.set([0, 0.0] if measured else None)
+        try:
+            started = time.perf_counter()
+            for _ in range(count):
+                connection.execute(text('SELECT 1'))
+            return (time.perf_counter() - started) / count
+        finally:
+            _request_db.reset(token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=20000)
+    args = parser.parse_args()
+
+    apps = {enabled: make_app(enabled) for enabled in (False, True)}
+    # Alternate runs so warm-up and drift hit both sides alike
+    per_request = {False: [], True: []}
+    for _ in range(3):
+        for enabled, app in apps.items():
+            per_request[enabled].append(time_requests(app, args.requests))
+    off, on = min(per_request[False]), min(per_request[True])
+    print(f'{args.requests} cached book reads')
+    print(f'  metrics off {off * 1e6:8.1f} us/request')
+    print(f'  metrics on  {on * 1e6:8.1f} us/request   ({(on - off) * 1e6:+.1f} us)')
+
+    idle = min(time_queries(apps[True], args.queries, measured=False) for _ in range(3))
+    measured = min(time_queries(apps[True], args.queries, measured=True) for _ in range(3))
+    print(f'{args.queries} SELECT 1 queries')
+    print(f'  outside a request {idle * 1e6:8.1f} us/query')
+    print(f'  measured          {measured * 1e6:8.1f} us/query   ({(measured - idle) * 1e6:+.1f} us)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Compare JSON serialization speed and response size on the wire.
+
+    python -m benchmarks.serialization [--rows 100] [--repeat 200]
+"""
+import argparse
+import gzip
+import timeit
+import zlib
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+
+from app.json_provider import JSONProvider, OrjsonProvider, orjson
+
+
+def book_page(rows):
+    """A listing page shaped like ``GET /api/books`` output"""
+    now = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    return {
+        'items': [{
+            'id': i,
+            'title': f'Book title number {i}',
+            'author': f'Author {i % 50}',
+            'isbn': f'{9780000000000 + i}',
+            'published_date': date(2000, 1, 1) + timedelta(days=i),
+            'publisher': 'Example Publishing',
+            'description': 'A long catalog description of the book. ' * 12,
+            'total_copies': 3,
+            'available_copies': 2,
+            'date_added': now - timedelta(minutes=i),
+            'updated_at': now,
+        } for i in range(rows)],
+        'total': rows * 100,
+        'pages': 100,
+        'current_page': 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    payload = book_page(args.rows)
+    providers = {'stdlib json': JSONProvider(app)}
+    if orjson is not None:
+        providers['orjson'] = OrjsonProvider(app)
+
+    print(f'Serializing a page of {args.rows} books, {args.repeat} times')
+    print(f"{'provider':<12} {'ms/page':>10}")
+    for name, provider in providers.items():
+        seconds = timeit.timeit(lambda: provider.dumps(payload), number=args.repeat)
+        print(f'{name:<12} {seconds / args.repeat * 1000:>10.3f}')
+
+    body = JSONProvider(app).dumps(payload).encode()
+    print()
+    print(f"{'encoding':<12} {'bytes':>10} {'ratio':>8}")
+    for name, data in [('identity', body),
+                       ('gzip', gzip.compress(body, compresslevel=6)),
+                       ('deflate', zlib.compress(body, 6))]:
+        print(f'{name:<12} {len(data):>10} {len(data) / len(body):>8.2%}')
+
+
+if __name__ == '__main__':
+    main()
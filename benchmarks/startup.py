@@ -0,0 +1,80 @@
+"""Measure cold start: importing the app package and building an app.
+
+    python -m benchmarks.startup [--runs 10] [--top 10]
+
+Every run is a fresh interpreter, as for a newly started worker, against a
+SQLite file that already has its tables. Runs with tables created on
+start-up are compared with fast-start mode (``CREATE_TABLES_ON_STARTUP``
+off). ``--top`` lists the slowest imports, from ``python -X importtime``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from app import create_app, db
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1], 'CREATE_TABLES_ON_STARTUP': sys.argv[2] == '1'})
+built = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': built - imported}))
+'''
+
+
+def probe(database_uri, create_tables):
+    output = subprocess.run([sys.executable, '-c', PROBE, database_uri, str(int(create_tables))],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def slowest_imports(database_uri, count):
+    """``(cumulative microseconds, module)`` of the slowest top-level imports
+    made while starting in fast-start mode"""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE, database_uri, '0'],
+                            capture_output=True, text=True, check=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # Only direct imports of the app package and its dependencies
+        if len(name) - len(name.lstrip()) <= 3:
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_uri = 'sqlite:///' + os.path.join(tmp, 'library.db')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri})
+        with app.app_context():
+            db.create_all()
+            db.engine.dispose()
+
+        print(f"{'mode':<14} {'import ms':>10} {'create_app ms':>14} {'total ms':>9}  (median of {args.runs})")
+        for mode, create_tables in (('create tables', True), ('fast start', False)):
+            runs = [probe(database_uri, create_tables) for _ in range(args.runs)]
+            imported = statistics.median(run['import'] for run in runs) * 1000
+            built = statistics.median(run['create_app'] for run in runs) * 1000
+            print(f'{mode:<14} {imported:>10.1f} {built:>14.1f} {imported + built:>9.1f}')
+
+        if args.top:
+            print('\nSlowest imports at start-up (cumulative ms)')
+            for microseconds, name in slowest_imports(database_uri, args.top):
+                print(f'{microseconds / 1000:>8.1f}  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -15,8 +15,72 @@ class Config:
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Read replicas, comma separated; reads made by GET requests are spread over them
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+                               if uri]
+    
+    # Create missing tables whenever the app is built; turn off for fast start-up
+    # and manage the schema with `flask db upgrade` or `flask create-tables`
+    CREATE_TABLES_ON_STARTUP = os.environ.get('CREATE_TABLES_ON_STARTUP', 'True').lower() in ('true', '1', 't')
+    
+    # Connection pool for server databases; SQLite keeps its default pool
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+    DATABASE_POOL_RECYCLE = 1800  # Seconds; reconnect before servers drop idle connections
+    DATABASE_POOL_TIMEOUT = 30  # Seconds to wait for a free connection
+    DATABASE_POOL_PRE_PING = True  # Replace connections that died while idle
+    
+    # Applied to every new SQLite connection
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',  # Readers don't wait for writers
+        'synchronous': 'NORMAL',  # Safe with WAL, fsyncs only at checkpoints
+        'busy_timeout': 5000,  # Milliseconds to wait for a lock instead of failing
+        'mmap_size': 268435456,  # Read the first 256 MiB through memory mapping
+    }
+    
+    # Response serialization: 'orjson' (falls back to stdlib if missing) or 'json'
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'orjson')
+    
+    # Response compression
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_SIZE = 1024  # Bytes; smaller bodies are sent as-is
+    COMPRESS_LEVEL = 6
+    COMPRESS_MIMETYPES = ['application/json', 'text/csv', 'text/plain']
+    
+    # Request metrics, exported in Prometheus format at METRICS_PATH
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() in ('true', '1', 't')
+    METRICS_PATH = '/metrics'
+    METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # Seconds
+    METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', 'False').lower() in ('true', '1', 't')
+    
+    # Query profiling: flag statements repeated within a request (N+1 queries)
+    # and log slow queries with their plan; meant for development and tests
+    QUERY_PROFILING = os.environ.get('QUERY_PROFILING', 'False').lower() in ('true', '1', 't')
+    QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 10))  # Identical statements per request
+    QUERY_REPEAT_ACTION = os.environ.get('QUERY_REPEAT_ACTION', 'warn')  # 'warn' or 'raise'
+    QUERY_SLOW_MS = int(os.environ.get('QUERY_SLOW_MS', 100))  # 0 disables slow-query logging
+    
     # Pagination
     BOOKS_PER_PAGE = 10
+    BOOK_TOTALS_CACHE_TTL = 30  # Seconds to reuse a listing total; 0 disables
+    
+    # Single-book cache; set BOOK_CACHE_REDIS_URL to share it between processes.
+    # Writes only invalidate the in-process cache of the worker that made
+    # them, so without Redis entries live just long enough to absorb bursts
+    BOOK_CACHE_REDIS_URL = os.environ.get('BOOK_CACHE_REDIS_URL')
+    BOOK_CACHE_TTL = int(os.environ.get('BOOK_CACHE_TTL', 300 if BOOK_CACHE_REDIS_URL else 5))  # Seconds; 0 disables
+    BOOK_CACHE_MAX_ENTRIES = 10000  # In-process cache only
+    
+    # Bulk import
+    BULK_IMPORT_CHUNK_SIZE = 500  # Rows validated and committed together
+    
+    # Library operations
+    LIBRARY_BATCH_MAX_ITEMS = 1000  # Checkouts plus returns per batch request
+    # Seconds between sweeps in a background thread of the app; off by default.
+    # Sweeps keep the overdue report's unflagged set small; it is correct without.
+    # Enable it in one process only, or run `flask library sweep-overdue --every N`
+    OVERDUE_SWEEP_INTERVAL = int(os.environ.get('OVERDUE_SWEEP_INTERVAL', 0))
+    OVERDUE_PER_PAGE = 100
     
     # JWT Configuration
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-dev-key-change-me'
@@ -29,9 +93,34 @@ class Config:
     JWT_ACCESS_CSRF_HEADER_NAME = 'X-CSRF-TOKEN'
     JWT_REFRESH_CSRF_HEADER_NAME = 'X-CSRF-REFRESH-TOKEN'
     
-    # CORS Configuration
-    CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '').split(',')
+    # Password hashing; stored hashes made with another method are upgraded on login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    # Processes; 0 hashes inline. More than one per CPU only adds contention
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS',
+                                               min(2, os.cpu_count() or 1)))
+    # Hashes running or queued before requests get a 503. Each one holds a
+    # request thread, so keep this well below the server's thread count
+    PASSWORD_HASH_MAX_PENDING = 4
+    PASSWORD_HASH_TIMEOUT = 10  # Seconds to wait for a hash before giving up
+    PASSWORD_HASH_RETRY_AFTER = 2  # Seconds, sent in Retry-After when hashing is busy
+    PASSWORD_HASH_NICENESS = 10  # Hashing processes yield the CPU to request threads
+    
+    # Cache of users looked up from JWTs.
+    # Set USER_CACHE_REDIS_URL (defaults to BOOK_CACHE_REDIS_URL) to share it, so
+    # profile and admin changes reach every worker on commit; an in-process
+    # cache only hears of its own worker's changes, so it keeps users briefly
+    USER_CACHE_REDIS_URL = os.environ.get('USER_CACHE_REDIS_URL', BOOK_CACHE_REDIS_URL)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60 if USER_CACHE_REDIS_URL else 5))  # Seconds; 0 disables
+    USER_CACHE_MAX_ENTRIES = 10000  # In-process cache only
+    
+    # CORS Configuration; '*' in CORS_ORIGINS allows any origin
+    CORS_ORIGINS = [origin for origin in os.environ.get('CORS_ORIGINS', '').split(',') if origin]
     CORS_SUPPORTS_CREDENTIALS = True
+    CORS_PATH_PREFIX = '/api/'
+    CORS_ALLOW_HEADERS = ('Content-Type', 'Authorization', 'X-CSRF-TOKEN')
+    CORS_METHODS = ('GET', 'POST', 'PUT', 'DELETE', 'OPTIONS')
+    CORS_EXPOSE_HEADERS = ('X-CSRF-TOKEN',)
+    CORS_MAX_AGE = int(os.environ.get('CORS_MAX_AGE', 7200))  # Seconds browsers cache a preflight
     
     # Security Headers
     SESSION_COOKIE_HTTPONLY = True
@@ -50,6 +139,9 @@ class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     SQLALCHEMY_ECHO = True
+    METRICS_SERVER_TIMING = True
+    CORS_ORIGINS = Config.CORS_ORIGINS or ['*']  # Any origin unless CORS_ORIGINS is set
+    QUERY_PROFILING = os.environ.get('QUERY_PROFILING', 'True').lower() in ('true', '1', 't')
 
 
 class TestingConfig(Config):
@@ -57,10 +149,18 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'  # Fast hashes keep the suite quick
+    PASSWORD_HASH_WORKERS = 0
+    CREATE_TABLES_ON_STARTUP = False  # Tests create their tables
+    QUERY_PROFILING = os.environ.get('QUERY_PROFILING', 'True').lower() in ('true', '1', 't')
+    QUERY_REPEAT_ACTION = 'raise'  # An N+1 query fails the test that triggers it
 
 
 class ProductionConfig(Config):
     """Production configuration"""
+    CREATE_TABLES_ON_STARTUP = os.environ.get('CREATE_TABLES_ON_STARTUP', 'False').lower() in ('true', '1', 't')
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 10))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 20))
     JWT_COOKIE_SECURE = True
     SESSION_COOKIE_SECURE = True
     
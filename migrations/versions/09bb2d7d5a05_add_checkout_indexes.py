@@ -0,0 +1,35 @@
+"""Add checkout indexes
+
+Revision ID: 09bb2d7d5a05
+Revises: 61c4463954d1
+Create Date: 2026-10-17 11:21:05.902317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '09bb2d7d5a05'
+down_revision = '61c4463954d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Active checkouts are indexed partially where the backend supports it
+    active = sa.text('return_date IS NULL')
+    op.create_index('ix_checkouts_active_book_user', 'checkouts',
+                    ['book_id', 'user_id', 'return_date'], unique=False,
+                    sqlite_where=active, postgresql_where=active)
+    op.create_index('ix_checkouts_active_due_date', 'checkouts',
+                    ['return_date', 'due_date'], unique=False,
+                    sqlite_where=active, postgresql_where=active)
+    op.create_index('ix_checkouts_user_checkout_date', 'checkouts',
+                    ['user_id', 'checkout_date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_checkouts_user_checkout_date', table_name='checkouts')
+    op.drop_index('ix_checkouts_active_due_date', table_name='checkouts')
+    op.drop_index('ix_checkouts_active_book_user', table_name='checkouts')
@@ -0,0 +1,46 @@
+"""Add overdue tracking
+
+Revision ID: 48f216d1dc59
+Revises: 8e4e65b8a677
+Create Date: 2026-10-17 15:02:37.481920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '48f216d1dc59'
+down_revision = '8e4e65b8a677'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('checkouts', sa.Column('overdue', sa.Boolean(), nullable=False,
+                                         server_default=sa.false()))
+    # Open checkouts not flagged yet, read by sweeps and the overdue report;
+    # it replaces the index of all open checkouts by due date
+    op.create_index('ix_checkouts_unflagged_due_date', 'checkouts',
+                    ['return_date', 'overdue', 'due_date'], unique=False,
+                    sqlite_where=sa.text('return_date IS NULL AND overdue = 0'),
+                    postgresql_where=sa.text('return_date IS NULL AND NOT overdue'))
+    op.drop_index('ix_checkouts_active_due_date', table_name='checkouts')
+    # Flagged checkouts
+    op.create_index('ix_checkouts_overdue_due_date', 'checkouts', ['due_date', 'id'],
+                    unique=False, sqlite_where=sa.text('overdue = 1'),
+                    postgresql_where=sa.text('overdue'))
+    op.create_index('ix_checkouts_overdue_user', 'checkouts', ['user_id', 'due_date', 'id'],
+                    unique=False, sqlite_where=sa.text('overdue = 1'),
+                    postgresql_where=sa.text('overdue'))
+
+
+def downgrade():
+    op.drop_index('ix_checkouts_overdue_user', table_name='checkouts')
+    op.drop_index('ix_checkouts_overdue_due_date', table_name='checkouts')
+    op.create_index('ix_checkouts_active_due_date', 'checkouts',
+                    ['return_date', 'due_date'], unique=False,
+                    sqlite_where=sa.text('return_date IS NULL'),
+                    postgresql_where=sa.text('return_date IS NULL'))
+    op.drop_index('ix_checkouts_unflagged_due_date', table_name='checkouts')
+    op.drop_column('checkouts', 'overdue')
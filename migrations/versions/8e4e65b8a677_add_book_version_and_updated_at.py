@@ -0,0 +1,28 @@
+"""Add book version and updated_at
+
+Revision ID: 8e4e65b8a677
+Revises: 09bb2d7d5a05
+Create Date: 2026-10-17 13:40:52.117306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4e65b8a677'
+down_revision = '09bb2d7d5a05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('books', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('books', sa.Column('version', sa.Integer(), nullable=False,
+                                     server_default='1'))
+    op.execute('UPDATE books SET updated_at = date_added')
+
+
+def downgrade():
+    op.drop_column('books', 'version')
+    op.drop_column('books', 'updated_at')
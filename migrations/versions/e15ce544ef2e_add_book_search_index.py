@@ -0,0 +1,70 @@
+"""Add book search index
+
+Revision ID: e15ce544ef2e
+Revises: 64789091fdb6
+Create Date: 2026-10-17 09:12:41.318204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e15ce544ef2e'
+down_revision = '64789091fdb6'
+branch_labels = None
+depends_on = None
+
+COLUMNS = 'title, author, publisher, description, isbn'
+NEW_COLUMNS = 'new.title, new.author, new.publisher, new.description, new.isbn'
+OLD_COLUMNS = 'old.title, old.author, old.publisher, old.description, old.isbn'
+
+PG_TSVECTOR = (
+    "to_tsvector('simple', coalesce(books.title, '') || ' ' || "
+    "coalesce(books.author, '') || ' ' || coalesce(books.publisher, '') || ' ' || "
+    "coalesce(books.description, '') || ' ' || coalesce(books.isbn, ''))"
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'sqlite':
+        op.execute(
+            f"CREATE VIRTUAL TABLE books_fts USING fts5({COLUMNS}, "
+            "content='books', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "CREATE TRIGGER books_fts_ai AFTER INSERT ON books BEGIN "
+            f"INSERT INTO books_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW_COLUMNS}); END"
+        )
+        op.execute(
+            "CREATE TRIGGER books_fts_ad AFTER DELETE ON books BEGIN "
+            f"INSERT INTO books_fts(books_fts, rowid, {COLUMNS}) "
+            f"VALUES ('delete', old.id, {OLD_COLUMNS}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER books_fts_au AFTER UPDATE OF {COLUMNS} ON books BEGIN "
+            f"INSERT INTO books_fts(books_fts, rowid, {COLUMNS}) "
+            f"VALUES ('delete', old.id, {OLD_COLUMNS}); "
+            f"INSERT INTO books_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW_COLUMNS}); END"
+        )
+        # Backfill the index from the existing rows
+        op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+    elif dialect == 'postgresql':
+        # Expression indexes are populated from existing rows on creation
+        op.execute(f"CREATE INDEX ix_books_search ON books USING GIN ({PG_TSVECTOR})")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS books_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS books_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS books_fts_ai")
+        op.execute("DROP TABLE IF EXISTS books_fts")
+
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_books_search")
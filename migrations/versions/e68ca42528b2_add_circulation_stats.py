@@ -0,0 +1,48 @@
+"""Add circulation statistics
+
+Revision ID: e68ca42528b2
+Revises: 48f216d1dc59
+Create Date: 2026-10-17 16:20:11.305417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e68ca42528b2'
+down_revision = '48f216d1dc59'
+branch_labels = None
+depends_on = None
+
+# Must match app.library.stats.TOTALS_SHARDS
+TOTALS_SHARDS = 16
+
+
+def upgrade():
+    for name, key in (('book_stats', 'book_id'), ('user_stats', 'user_id'),
+                      ('circulation_totals', 'shard')):
+        op.create_table(name,
+        sa.Column(key, sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('loans', sa.Integer(), nullable=False),
+        sa.Column('active_loans', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint(key)
+        )
+    op.create_index('ix_book_stats_loans', 'book_stats', ['loans', 'book_id'], unique=False)
+    op.create_index('ix_user_stats_loans', 'user_stats', ['loans', 'user_id'], unique=False)
+
+    # Backfill from the existing checkouts
+    active = 'SUM(CASE WHEN return_date IS NULL THEN 1 ELSE 0 END)'
+    for name, key, group in (('book_stats', 'book_id', 'book_id'),
+                             ('user_stats', 'user_id', 'user_id'),
+                             ('circulation_totals', 'shard', f'book_id % {TOTALS_SHARDS}')):
+        op.execute(f'INSERT INTO {name} ({key}, loans, active_loans) '
+                   f'SELECT {group}, COUNT(*), {active} FROM checkouts GROUP BY {group}')
+
+
+def downgrade():
+    op.drop_index('ix_user_stats_loans', table_name='user_stats')
+    op.drop_index('ix_book_stats_loans', table_name='book_stats')
+    op.drop_table('circulation_totals')
+    op.drop_table('user_stats')
+    op.drop_table('book_stats')
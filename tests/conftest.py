@@ -0,0 +1,50 @@
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import db
+
+
+@pytest.fixture
+def record_statements():
+    """Return a context manager collecting ``(sql, parameters)`` for every
+    statement sent to the database, on any engine, while it is active."""
+    @contextmanager
+    def recorder():
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+        event.listen(Engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record)
+
+    return recorder
+
+
+@pytest.fixture
+def query_plan(app):
+    """Return a function giving SQLite's EXPLAIN QUERY PLAN text for a statement."""
+    def explain(statement, parameters=()):
+        with app.app_context():
+            rows = db.session.connection().exec_driver_sql(
+                'EXPLAIN QUERY PLAN ' + statement, parameters
+            ).all()
+        return ' '.join(row[-1] for row in rows)
+    return explain
+
+
+@pytest.fixture
+def assert_max_queries(record_statements):
+    """Return a context manager failing the test if more than ``limit``
+    statements are sent to the database while it is active."""
+    @contextmanager
+    def check(limit):
+        with record_statements() as statements:
+            yield statements
+        assert len(statements) <= limit, (
+            f'{len(statements)} queries issued, expected at most {limit}:\n'
+            + '\n'.join(sql for sql, _ in statements)
+        )
+    return check
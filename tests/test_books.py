@@ -42,6 +42,18 @@ def client(app):
     """A test client for the app."""
     return app.test_client()
 
+def admin_headers(app):
+    from flask_jwt_extended import create_access_token
+    from app.models import User
+    with app.app_context():
+        admin = User(name='Admin', email='admin@example.com', is_admin=True)
+        admin.set_password('secret-password')
+        db.session.add(admin)
+        db.session.commit()
+        token = create_access_token(identity={
+            'id': admin.id, 'email': admin.email, 'is_admin': True})
+    return {'Authorization': f'Bearer {token}'}
+
 def test_get_books(client):
     """Test getting all books."""
     response = client.get('/api/books')
@@ -91,8 +103,430 @@ def test_update_book(client):
 def test_delete_book(client):
     """Test deleting a book."""
     response = client.delete('/api/books/1')
-    assert response.status_code == 200
+    assert response.status_code == 204
     
     # Verify the book was deleted
     response = client.get('/api/books/1')
     assert response.status_code == 404
+
+def test_search_books(client):
+    """Test searching books by word prefix across indexed columns."""
+    client.post('/api/books', json={
+        'title': 'The Great Gatsby',
+        'author': 'F. Scott Fitzgerald',
+        'isbn': '9780743273565',
+        'publisher': 'Scribner',
+    })
+    response = client.get('/api/books?search=gats fitz')
+    data = response.get_json()
+    assert [b['title'] for b in data['items']] == ['The Great Gatsby']
+    assert data['total'] == 1
+
+    response = client.get('/api/books?search=scribner')
+    assert len(response.get_json()['items']) == 1
+
+    response = client.get('/api/books?search=9780743273565')
+    assert len(response.get_json()['items']) == 1
+
+def test_search_ranks_by_relevance(client):
+    """Test that better matches are listed first."""
+    client.post('/api/books', json={
+        'title': 'Gardening',
+        'author': 'Someone Else',
+        'isbn': '1111111111',
+        'description': 'Mentions dune once.',
+    })
+    client.post('/api/books', json={
+        'title': 'Dune',
+        'author': 'Frank Herbert',
+        'isbn': '2222222222',
+        'description': 'Dune, the desert planet of dune.',
+    })
+    response = client.get('/api/books?search=dune')
+    titles = [b['title'] for b in response.get_json()['items']]
+    assert titles == ['Dune', 'Gardening']
+
+def test_search_index_follows_updates_and_deletes(client):
+    """Test that the search index stays in sync with writes."""
+    client.put('/api/books/1', json={'title': 'Renamed Volume', 'description': ''})
+    assert client.get('/api/books?search=renamed').get_json()['total'] == 1
+    assert client.get('/api/books?search=a test book').get_json()['total'] == 0
+
+    client.delete('/api/books/1')
+    assert client.get('/api/books?search=renamed').get_json()['total'] == 0
+
+def add_books(count, date_added):
+    """Add ``count`` books that all share one ``date_added`` timestamp."""
+    for i in range(count):
+        db.session.add(Book(
+            title=f'Bulk Book {i}',
+            author='Bulk Author',
+            isbn=f'{9000000000 + i}',
+            date_added=date_added,
+        ))
+    db.session.commit()
+
+def test_cursor_pagination_walks_catalog(app, client):
+    """Test that cursor mode visits every book exactly once, newest first."""
+    from datetime import datetime
+    with app.app_context():
+        add_books(23, datetime(2024, 1, 1))
+
+    seen, cursor = [], ''
+    while cursor is not None:
+        response = client.get(f'/api/books?per_page=5&cursor={cursor}')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert 'total' not in data
+        seen.extend(book['id'] for book in data['items'])
+        cursor = data['next_cursor']
+
+    assert seen[0] == 1  # the fixture book is the most recently added
+    assert sorted(seen) == list(range(1, 25))
+    assert len(seen) == len(set(seen))
+
+def test_cursor_pages_cost_the_same(app, client, record_statements, query_plan):
+    """Test that a deep page issues the same single index seek as page 1."""
+    from datetime import datetime
+    with app.app_context():
+        add_books(40, datetime(2024, 1, 1))
+
+    pages, cursor = [], ''
+    while cursor is not None:
+        with record_statements() as statements:
+            data = client.get(f'/api/books?per_page=5&cursor={cursor}').get_json()
+        pages.append(statements)
+        cursor = data['next_cursor']
+
+    assert all(len(page) == 1 for page in pages)
+    assert not any('count(' in page[0][0].lower() for page in pages)
+
+    details = query_plan(*pages[-1][0])
+    assert 'ix_books_date_added_id' in details
+    assert 'TEMP B-TREE' not in details
+
+def test_cursor_rejects_garbage(client):
+    """Test that an invalid cursor is a client error."""
+    response = client.get('/api/books?cursor=not-a-cursor')
+    assert response.status_code == 400
+
+def test_listing_without_total(client, record_statements):
+    """Test that with_total=false skips the COUNT(*) query."""
+    with record_statements() as statements:
+        data = client.get('/api/books?with_total=false').get_json()
+    assert len(data['items']) == 1
+    assert data['total'] is None and data['pages'] is None
+    assert not any('count(' in sql.lower() for sql, _ in statements)
+
+def test_listing_totals_are_cached(client, record_statements):
+    """Test that totals are reused per search and reset by writes."""
+    def count_queries(url):
+        with record_statements() as statements:
+            data = client.get(url).get_json()
+        return data['total'], sum('count(' in sql.lower() for sql, _ in statements)
+
+    assert count_queries('/api/books?search=Test Book') == (1, 1)
+    assert count_queries('/api/books?search=book  TEST') == (1, 0)
+    assert count_queries('/api/books?search=author&page=2') == (1, 1)
+
+    client.post('/api/books', json={
+        'title': 'Another Test Book',
+        'author': 'Someone',
+        'isbn': '5555555555',
+    })
+    assert count_queries('/api/books?search=test book') == (2, 1)
+
+    client.delete('/api/books/1')
+    assert count_queries('/api/books?search=test book') == (1, 1)
+
+def test_bulk_import_json(client):
+    """Test bulk importing a JSON array with a per-row error report."""
+    books = [
+        {'title': 'Bulk One', 'author': 'A', 'isbn': '1000000001', 'total_copies': 2},
+        {'title': 'Missing author', 'isbn': '1000000002'},
+        {'title': 'Bulk Three', 'author': 'C', 'isbn': '1000000003'},
+        {'title': 'Updated Test Book', 'author': 'Test Author', 'isbn': '1234567890',
+         'total_copies': 7},
+        {'title': 'Duplicate', 'author': 'D', 'isbn': '1000000001'},
+    ]
+    response = client.post('/api/books/bulk?chunk_size=2', json=books)
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report['created'], report['updated'], report['failed']) == (2, 1, 2)
+    assert [error['row'] for error in report['errors']] == [2, 5]
+    assert 'author' in report['errors'][0]['errors']
+
+    data = client.get('/api/books?per_page=10').get_json()
+    assert data['total'] == 3
+    book = client.get('/api/books/1').get_json()
+    assert book['title'] == 'Updated Test Book'
+    assert (book['total_copies'], book['available_copies']) == (7, 7)
+    assert client.get('/api/books?search=bulk').get_json()['total'] == 2
+
+def test_bulk_import_ndjson_and_csv(client):
+    """Test bulk importing streamed NDJSON and CSV bodies."""
+    ndjson = (
+        '{"title": "Line One", "author": "A", "isbn": "3000000001"}\n'
+        'not json\n'
+        '{"title": "Line Three", "author": "B", "isbn": "3000000003"}\n'
+    )
+    response = client.post('/api/books/bulk', data=ndjson,
+                           content_type='application/x-ndjson')
+    report = response.get_json()
+    assert (report['created'], report['failed']) == (2, 1)
+    assert report['errors'][0]['row'] == 2
+
+    csv_body = (
+        'title,author,isbn,published_date,total_copies\n'
+        'Csv One,A,4000000001,2001-02-03,4\n'
+        'Csv Two,B,4000000002,,\n'
+        'Csv Bad,C,notanisbn,,\n'
+    )
+    response = client.post('/api/books/bulk', data=csv_body, content_type='text/csv')
+    report = response.get_json()
+    assert (report['created'], report['failed']) == (2, 1)
+    assert client.get('/api/books?search=csv one').get_json()['items'][0]['total_copies'] == 4
+
+def test_bulk_import_reports_undecodable_rows(client):
+    """Test rows that aren't valid UTF-8, and null array items, get their own errors."""
+    ndjson = b'{"title": "Bytes \xff", "author": "A", "isbn": "3000000011"}\n' \
+             b'{"title": "Fine", "author": "B", "isbn": "3000000012"}\n'
+    csv_body = b'title,author,isbn\nCaf\xe9,A,4000000011\nCafe,B,4000000012\n'
+    for body, content_type in ((ndjson, 'application/x-ndjson'), (csv_body, 'text/csv')):
+        response = client.post('/api/books/bulk', data=body, content_type=content_type)
+        assert response.status_code == 200
+        report = response.get_json()
+        assert (report['created'], report['failed']) == (1, 1)
+        assert report['errors'] == [{'row': 1, 'errors': {'_schema': ['Invalid UTF-8.']}}]
+
+    report = client.post('/api/books/bulk', json=[None]).get_json()
+    assert report['failed'] == 1
+    assert report['errors'][0]['errors'] == {'_schema': ['Invalid input type.']}
+
+def test_bulk_import_generic_backend(app):
+    """Test the executemany fallback used without ON CONFLICT support."""
+    from app.books.bulk import import_books
+    rows = enumerate([
+        {'title': 'Fallback New', 'author': 'A', 'isbn': '5000000001'},
+        {'title': 'Fallback Update', 'author': 'B', 'isbn': '1234567890', 'total_copies': 3},
+    ], 1)
+    with app.app_context():
+        report = import_books(rows, 10, 'generic')
+        assert (report['created'], report['updated']) == (1, 1)
+        book = db.session.get(Book, 1)
+        assert (book.title, book.total_copies, book.available_copies) == ('Fallback Update', 3, 3)
+
+def test_bulk_import_keeps_copies_on_loan(app, client):
+    """Test an import can't lower a total below the copies on loan, nor go negative."""
+    from app.books.bulk import write_chunk
+    with app.app_context():
+        book = db.session.get(Book, 1)
+        book.total_copies, book.available_copies = 5, 2
+        db.session.commit()
+    books = [{'title': 'Test Book', 'author': 'Test Author', 'isbn': '1234567890',
+              'total_copies': 1}]
+    report = client.post('/api/books/bulk', json=books).get_json()
+    assert report['failed'] == 1
+    assert 'total_copies' in report['errors'][0]['errors']
+    books[0]['total_copies'] = 4
+    assert client.post('/api/books/bulk', json=books).get_json()['updated'] == 1
+    with app.app_context():
+        assert db.session.get(Book, 1).available_copies == 1
+        # Loans taken out after the check still can't make stock negative
+        for dialect in ('sqlite', 'generic'):
+            write_chunk([dict(books[0], total_copies=1)], {'1234567890'}, dialect)
+            book = db.session.get(Book, 1)
+            db.session.refresh(book)
+            assert (book.total_copies, book.available_copies) == (1, 0)
+            db.session.rollback()
+
+def test_bulk_import_rejects_non_list(client):
+    """Test that a JSON body that is not an array is rejected."""
+    response = client.post('/api/books/bulk', json={'title': 'x'})
+    assert response.status_code == 400
+
+class FakeRedis:
+    """Stand-in for a Redis client, covering what RedisCache uses."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def set(self, name, value, ex=None, nx=False):
+        if nx and name in self.data:
+            return None
+        self.data[name] = value.encode()
+        return True
+
+    def delete(self, *names):
+        for name in names:
+            self.data.pop(name, None)
+
+    def scan_iter(self, match):
+        return [name for name in self.data if name.startswith(match.rstrip('*'))]
+
+@pytest.mark.parametrize('backend', ['memory', 'redis'])
+def test_book_cache(app, client, assert_max_queries, backend):
+    """Test that single books are served from cache and invalidated on writes."""
+    from datetime import datetime, timedelta
+    from app.cache import RedisCache
+    if backend == 'redis':
+        app.extensions['book_cache'] = RedisCache(FakeRedis(), ttl=60)
+
+    first = client.get('/api/books/1')
+    assert first.headers['X-Cache'] == 'MISS'
+    with assert_max_queries(0):
+        second = client.get('/api/books/1')
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_json() == first.get_json()
+
+    # Checkouts and returns change available_copies
+    response = client.post('/api/library/checkout', json={
+        'book_id': 1, 'user_id': 1,
+        'due_date': (datetime.utcnow() + timedelta(days=14)).isoformat() + 'Z'})
+    book = client.get('/api/books/1')
+    assert book.headers['X-Cache'] == 'MISS'
+    assert book.get_json()['available_copies'] == 4
+
+    client.post(f"/api/library/return/{response.get_json()['checkout_id']}")
+    assert client.get('/api/books/1').get_json()['available_copies'] == 5
+
+    client.put('/api/books/1', json={'title': 'Cached Title'})
+    assert client.get('/api/books/1').get_json()['title'] == 'Cached Title'
+
+    client.delete('/api/books/1')
+    assert client.get('/api/books/1').status_code == 404
+
+    assert client.get('/api/books/cache').status_code == 401
+    stats = client.get('/api/books/cache', headers=admin_headers(app)).get_json()
+    assert (stats['backend'], stats['hits'], stats['misses']) == (backend, 1, 5)
+
+def test_book_cache_ignores_entries_loaded_before_a_write(app, client):
+    """Test a reader racing a checkout can't put a stale copy back in the cache."""
+    from datetime import datetime, timedelta
+    from app.books.routes import book_cache_entry
+    from app.cache import book_cache_lookup
+    cache = app.extensions['book_cache']
+    with app.app_context():
+        # A reader looks the book up and loads it...
+        key, entry = book_cache_lookup(cache, 1)
+        stale = book_cache_entry(db.session.get(Book, 1))
+    # ...a checkout commits and invalidates...
+    client.post('/api/library/checkout', json={
+        'book_id': 1, 'user_id': 1,
+        'due_date': (datetime.utcnow() + timedelta(days=14)).isoformat() + 'Z'})
+    # ...and only then does the reader store its copy
+    cache.set(key, stale)
+
+    response = client.get('/api/books/1')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.get_json()['available_copies'] == 4
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Test the in-process cache's size bound and expiry."""
+    from app.cache import TTLCache
+    now = [0]
+    cache = TTLCache(ttl=10, maxsize=2, clock=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    now[0] = 10
+    assert cache.get('a') is None and len(cache) == 1
+
+def test_book_conditional_get(app, client, record_statements):
+    """Test ETag/Last-Modified revalidation of a single book."""
+    response = client.get('/api/books/1')
+    etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+    response = client.get('/api/books/1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    # Without a cache entry only the version is looked up
+    app.extensions['book_cache'].clear()
+    with record_statements() as statements:
+        response = client.get('/api/books/1', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+    assert len(statements) == 1
+    assert 'books.description' not in statements[0][0]
+
+    client.put('/api/books/1', json={'title': 'Changed'})
+    response = client.get('/api/books/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['title'] == 'Changed'
+
+    app.extensions['book_cache'].clear()
+    response = client.get('/api/books/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+def test_listing_conditional_get(client, record_statements):
+    """Test ETag revalidation of a listing page."""
+    from datetime import datetime, timedelta
+    response = client.get('/api/books?search=test')
+    etag = response.headers['ETag']
+
+    with record_statements() as statements:
+        response = client.get('/api/books?search=test', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    # Total comes from the cache; the page is checked by id and version only
+    assert len(statements) == 1
+    assert 'books.title' not in statements[0][0]
+
+    # Availability changes bump the book's version
+    client.post('/api/library/checkout', json={
+        'book_id': 1, 'user_id': 1,
+        'due_date': (datetime.utcnow() + timedelta(days=14)).isoformat() + 'Z'})
+    response = client.get('/api/books?search=test', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['items'][0]['available_copies'] == 4
+
+@pytest.mark.parametrize('provider', ['orjson', 'json'])
+def test_json_provider_writes_iso_dates(provider):
+    """Test that both JSON providers render dates as ISO 8601."""
+    from datetime import datetime
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                      'JSON_PROVIDER': provider})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Book(title='Dated', author='A', isbn='8000000000',
+                            published_date=date(1999, 12, 31),
+                            date_added=datetime(2024, 5, 6, 7, 8, 9, 123456)))
+        db.session.commit()
+    data = app.test_client().get('/api/books/1').get_json()
+    assert data['published_date'] == '1999-12-31'
+    assert data['date_added'] == '2024-05-06T07:08:09.123456'
+
+def test_response_compression(client):
+    """Test gzip/deflate negotiation and the size threshold."""
+    import gzip, zlib
+    client.put('/api/books/1', json={'description': 'long description ' * 200})
+
+    response = client.get('/api/books', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    body = gzip.decompress(response.data)
+    assert b'long description' in body
+    assert len(response.data) < len(body) / 5
+
+    response = client.get('/api/books/1', headers={'Accept-Encoding': 'deflate'})
+    assert response.headers['Content-Encoding'] == 'deflate'
+    assert b'long description' in zlib.decompress(response.data)
+
+    # Compressed responses carry weak ETags that still revalidate
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    response = client.get('/api/books/1', headers={
+        'Accept-Encoding': 'deflate', 'If-None-Match': etag})
+    assert response.status_code == 304
+
+    response = client.get('/api/books/1')
+    assert 'Content-Encoding' not in response.headers
+
+    client.put('/api/books/1', json={'description': 'short'})
+    response = client.get('/api/books/1', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
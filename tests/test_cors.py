@@ -0,0 +1,68 @@
+import pytest
+from app import create_app, db
+from app.models import Book
+
+ORIGIN = 'https://library.example.com'
+
+@pytest.fixture
+def app():
+    app = create_app({'CORS_ORIGINS': [ORIGIN], 'CORS_MAX_AGE': 600})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Book(title='Shared', author='Author', isbn='9780000000004',
+                            total_copies=1, available_copies=1))
+        db.session.commit()
+    yield app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def preflight(client, path, origin=ORIGIN):
+    return client.options(path, headers={
+        'Origin': origin,
+        'Access-Control-Request-Method': 'POST',
+        'Access-Control-Request-Headers': 'Authorization, Content-Type',
+    })
+
+def test_preflight_is_answered_before_routing_and_jwt(client):
+    """Test preflights of protected endpoints get a cacheable 204 without a token."""
+    response = preflight(client, '/api/library/checkout')
+    assert response.status_code == 204
+    assert response.headers['Access-Control-Allow-Origin'] == ORIGIN
+    assert response.headers['Access-Control-Allow-Credentials'] == 'true'
+    assert response.headers['Access-Control-Allow-Methods'] == 'GET, POST, PUT, DELETE, OPTIONS'
+    assert 'Authorization' in response.headers['Access-Control-Allow-Headers']
+    assert response.headers['Access-Control-Max-Age'] == '600'
+    # Answered even for paths no route matches
+    assert preflight(client, '/api/no/such/path').status_code == 204
+
+def test_responses_carry_one_set_of_headers(client):
+    """Test an allowed origin gets each CORS header once, merged into Vary."""
+    response = client.get('/api/books/1', headers={'Origin': ORIGIN})
+    assert response.status_code == 200
+    assert response.headers.getlist('Access-Control-Allow-Origin') == [ORIGIN]
+    assert response.headers.getlist('Access-Control-Allow-Credentials') == ['true']
+    assert response.headers['Access-Control-Expose-Headers'] == 'X-CSRF-TOKEN'
+    assert 'Access-Control-Max-Age' not in response.headers
+    vary = response.headers.getlist('Vary')
+    assert len(vary) == 1 and 'Origin' in vary[0] and 'Accept-Encoding' in vary[0]
+
+def test_other_origins_get_no_cors_headers(client):
+    """Test origins outside CORS_ORIGINS, and non-API paths, are left alone."""
+    for response in (client.get('/api/books/1', headers={'Origin': 'https://evil.example'}),
+                     preflight(client, '/api/books', origin='https://evil.example')):
+        assert 'Access-Control-Allow-Origin' not in response.headers
+        assert 'Origin' in response.headers['Vary']
+    response = client.get('/metrics', headers={'Origin': ORIGIN})
+    assert 'Access-Control-Allow-Origin' not in response.headers
+
+def test_any_origin_is_echoed_with_credentials():
+    """Test '*' allows every origin, echoing it since credentials are allowed."""
+    client = create_app({'CORS_ORIGINS': ['*']}).test_client()
+    response = preflight(client, '/api/books', origin='https://anywhere.example')
+    assert response.headers['Access-Control-Allow-Origin'] == 'https://anywhere.example'
+    client = create_app({'CORS_ORIGINS': ['*'], 'CORS_SUPPORTS_CREDENTIALS': False}).test_client()
+    response = preflight(client, '/api/books', origin='https://anywhere.example')
+    assert response.headers['Access-Control-Allow-Origin'] == '*'
+    assert 'Vary' not in response.headers
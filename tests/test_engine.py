@@ -0,0 +1,102 @@
+import itertools
+from flask import Flask
+from app import create_app, db
+from app.engine import configure_engine_options
+from config import config
+
+def test_sqlite_connections_get_pragmas(tmp_path):
+    """Test that file databases run in WAL mode with the configured pragmas."""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'library.db'}"})
+    with app.app_context():
+        connection = db.session.connection()
+        pragma = lambda name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1  # NORMAL
+        assert pragma('busy_timeout') == 5000
+        assert pragma('mmap_size') == 268435456
+
+def test_server_databases_get_pool_settings():
+    """Test the pool profile for server databases, and that explicit options win."""
+    app = Flask(__name__)
+    app.config.from_object(config['production'])
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://library@db/library'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_recycle': 60}
+    configure_engine_options(app)
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {
+        'pool_size': 10, 'max_overflow': 20, 'pool_recycle': 60,
+        'pool_timeout': 30, 'pool_pre_ping': True,
+    }
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+    configure_engine_options(app)
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {'pool_pre_ping': True}
+
+def replicated_app(tmp_path, replicas=1):
+    """An app with a primary and ``replicas`` replica SQLite files, each
+    holding a book whose title says which database it came from."""
+    from app.models import Book
+    uris = [f"sqlite:///{tmp_path / f'replica{i}.db'}" for i in range(replicas)]
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+        'SQLALCHEMY_REPLICA_URIS': uris,
+        'BOOK_CACHE_TTL': 0,
+    })
+    with app.app_context():
+        engines = [db.engine] + list(itertools.islice(app.extensions['replicas'], replicas))
+        for number, engine in enumerate(engines):
+            db.metadata.create_all(engine)
+            with engine.begin() as connection:
+                connection.execute(Book.__table__.insert(), {
+                    'title': f'replica_{number - 1}' if number else 'primary', 'author': 'Author', 'isbn': '9780000000001',
+                    'total_copies': 1, 'available_copies': 1})
+    return app
+
+def test_get_requests_read_from_replicas(tmp_path):
+    """Test that GETs are spread over the replicas and writes go to the primary."""
+    app = replicated_app(tmp_path, replicas=2)
+    client = app.test_client()
+
+    titles = [client.get('/api/books/1').get_json()['title'] for _ in range(4)]
+    assert titles == ['replica_0', 'replica_1', 'replica_0', 'replica_1']
+
+    response = client.put('/api/books/1', json={'author': 'Updated'})
+    assert response.get_json()['title'] == 'primary'
+
+def test_writes_stick_to_primary_within_request(tmp_path):
+    """Test that a GET request reads its own writes from the primary."""
+    from app.models import Book
+    app = replicated_app(tmp_path)
+    with app.test_request_context(method='GET'):
+        assert db.session.get(Book, 1).title == 'replica_0'
+        db.session.add(Book(title='New', author='Author', isbn='9780000000002'))
+        db.session.flush()
+        assert db.session.query(Book.title).order_by(Book.id).all() == [('primary',), ('New',)]
+        db.session.rollback()
+
+    with app.test_request_context(method='POST'):
+        assert db.session.get(Book, 1).title == 'primary'
+
+def test_fast_start_does_no_database_io(tmp_path):
+    """Test building the app without creating tables never connects."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    connects = []
+    record = lambda *args: connects.append(args)
+    event.listen(Engine, 'connect', record)
+    try:
+        create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'lazy.db'}"})
+        assert not connects
+        create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'eager.db'}",
+                    'CREATE_TABLES_ON_STARTUP': True})
+        assert connects
+    finally:
+        event.remove(Engine, 'connect', record)
+
+def test_create_tables_command(tmp_path):
+    """Test the CLI creates the schema in fast-start mode."""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'library.db'}"})
+    result = app.test_cli_runner().invoke(args=['create-tables'])
+    assert 'Tables created.' in result.output
+    with app.app_context():
+        assert {'books', 'checkouts', 'users'} <= set(db.inspect(db.engine).get_table_names())
@@ -1,7 +1,9 @@
+import click
 import pytest
 from datetime import datetime, timedelta
 from app import create_app, db
-from app.models import Book, Checkout
+from app.models import Book, Checkout, User
+from app.library.overdue import sweep_overdue
 
 @pytest.fixture
 def app():
@@ -37,8 +39,9 @@ def app():
 
 @pytest.fixture
 def client(app):
-    """A test client for the app."""
-    return app.test_client()
+    """A test client for the app, with an app context for direct DB access."""
+    with app.app_context():
+        yield app.test_client()
 
 def test_checkout_book(client):
     """Test checking out a book."""
@@ -96,7 +99,6 @@ def test_get_user_checkouts(client):
     data = response.get_json()
     assert len(data) == 1
     assert data[0]['book_id'] == 1
-    assert data[0]['user_id'] == 1
 
 def test_get_overdue_books(client):
     """Test getting overdue books."""
@@ -124,3 +126,317 @@ def test_get_overdue_books(client):
     assert data[0]['book_id'] == 1
     assert data[0]['user_id'] == 1
     assert data[0]['days_overdue'] > 0
+
+def test_checkout_queries_use_indexes(client, record_statements, query_plan):
+    """Test that the checkout hot paths are index searches, not scans."""
+    for user_id in range(1, 4):
+        db.session.add(Checkout(
+            book_id=1,
+            user_id=user_id,
+            due_date=datetime.utcnow() - timedelta(days=user_id),
+            return_date=datetime.utcnow() if user_id == 3 else None,
+        ))
+    db.session.commit()
+    sweep_overdue()
+
+    def plans(method, url, **kwargs):
+        with record_statements() as statements:
+            getattr(client, method)(url, **kwargs)
+        # Primary key lookups (e.g. refreshing a new row) are not of interest
+        return [query_plan(sql, params) for sql, params in statements
+                if 'FROM checkouts' in sql and 'checkouts.id = ?' not in sql]
+
+    checkout_data = {
+        'book_id': 1,
+        'user_id': 4,
+        'due_date': (datetime.utcnow() + timedelta(days=14)).isoformat() + 'Z'
+    }
+    expected = {
+        'ix_checkouts_active_book_user': plans('post', '/api/library/checkout', json=checkout_data),
+        'ix_checkouts_user_checkout_date': plans('get', '/api/library/user/1'),
+        'ix_checkouts_overdue_due_date': plans('get', '/api/library/overdue'),
+        'ix_checkouts_overdue_user': plans('get', '/api/library/overdue?user_id=1'),
+    }
+    for index, details in expected.items():
+        assert details, index
+        for detail in details:
+            assert f'USING INDEX {index}' in detail or f'USING COVERING INDEX {index}' in detail
+            # Scanning a partial index only reads the rows it holds
+            assert 'SCAN checkouts' not in detail or index.startswith('ix_checkouts_overdue')
+    # Checkouts due since the last sweep come from the unflagged index
+    for detail in expected['ix_checkouts_overdue_due_date'] + expected['ix_checkouts_overdue_user']:
+        assert 'USING INDEX ix_checkouts_unflagged_due_date' in detail
+
+def test_checkout_listings_do_not_load_books_per_row(client, assert_max_queries):
+    """Test that listing many checkouts costs a single query."""
+    for i in range(5):
+        book = Book(title=f'Book {i}', author='Author', isbn=f'{2000000000 + i}')
+        db.session.add(book)
+        db.session.flush()
+        db.session.add(Checkout(
+            book_id=book.id,
+            user_id=1,
+            checkout_date=datetime.utcnow() - timedelta(days=30),
+            due_date=datetime.utcnow() - timedelta(days=i + 1),
+        ))
+    db.session.commit()
+    db.session.expunge_all()
+
+    with assert_max_queries(1):
+        response = client.get('/api/library/overdue')
+    data = response.get_json()
+    assert len(data) == 5
+    assert sorted(c['book_title'] for c in data) == [f'Book {i}' for i in range(5)]
+
+    with assert_max_queries(1):
+        response = client.get('/api/library/user/1')
+    data = response.get_json()
+    assert len(data) == 5
+    assert all(c['is_overdue'] for c in data)
+
+def test_get_overdue_books_streamed(client):
+    """Test the streamed NDJSON and CSV overdue reports."""
+    import csv, io, json
+    for days in (3, 10):
+        db.session.add(Checkout(
+            book_id=1,
+            user_id=days,
+            checkout_date=datetime.utcnow() - timedelta(days=30),
+            due_date=datetime.utcnow() - timedelta(days=days),
+        ))
+    db.session.commit()
+
+    response = client.get('/api/library/overdue?format=ndjson')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(r['days_overdue'] for r in rows) == [3, 10]
+    assert all(r['book_title'] == 'Test Book' for r in rows)
+
+    response = client.get('/api/library/overdue?format=csv')
+    assert response.is_streamed
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert sorted(int(r['user_id']) for r in rows) == [3, 10]
+
+    response = client.get('/api/library/overdue?format=xml')
+    assert response.status_code == 400
+
+def add_overdue(days, user_id=1):
+    checkout = Checkout(book_id=1, user_id=user_id,
+                        checkout_date=datetime.utcnow() - timedelta(days=30),
+                        due_date=datetime.utcnow() - timedelta(days=days))
+    db.session.add(checkout)
+    db.session.commit()
+    return checkout.id
+
+def test_sweep_overdue_flags_each_checkout_once(client):
+    """Test that each sweep flags only checkouts that became overdue since the last."""
+    now = datetime.utcnow()
+    add_overdue(days=2)
+    db.session.add(Checkout(book_id=1, user_id=2, due_date=now + timedelta(hours=1)))
+    db.session.commit()
+
+    assert sweep_overdue(now) == 1
+    assert sweep_overdue(now) == 0
+    # The second checkout's due date passes
+    assert sweep_overdue(now + timedelta(hours=2)) == 1
+    # A checkout recorded late, already past the swept window
+    add_overdue(days=5, user_id=3)
+    assert sweep_overdue(now + timedelta(hours=3)) == 1
+    # One committed late with an id below those already swept
+    db.session.add(Checkout(id=1000, book_id=1, user_id=4, due_date=now + timedelta(days=1)))
+    db.session.add(Checkout(id=10, book_id=1, user_id=5, due_date=now - timedelta(days=1)))
+    db.session.commit()
+    assert sweep_overdue(now + timedelta(hours=3)) == 1
+    assert Checkout.query.filter_by(overdue=True).count() == 4
+
+def test_returned_checkouts_leave_overdue_report(client):
+    """Test that returning a flagged checkout takes it off the report."""
+    checkout_id = add_overdue(days=2)
+    sweep_overdue()
+    assert len(client.get('/api/library/overdue').get_json()) == 1
+
+    assert client.post(f'/api/library/return/{checkout_id}').status_code == 200
+    assert client.get('/api/library/overdue').get_json() == []
+    assert sweep_overdue() == 0
+
+def test_overdue_filters_and_pagination(client):
+    """Test filtering the overdue report by user and days overdue, a page at a time."""
+    # The report merges flagged checkouts with ones that became due since
+    add_overdue(5, user_id=2)
+    add_overdue(9, user_id=1)
+    sweep_overdue()
+    add_overdue(2, user_id=1)
+
+    def days(url):
+        return [c['days_overdue'] for c in client.get(url).get_json()]
+
+    assert days('/api/library/overdue') == [9, 5, 2]
+    assert days('/api/library/overdue?user_id=1') == [9, 2]
+    assert days('/api/library/overdue?min_days_overdue=5') == [9, 5]
+    assert days('/api/library/overdue?max_days_overdue=5') == [5, 2]
+
+    response = client.get('/api/library/overdue?per_page=2')
+    assert len(response.get_json()) == 2
+    next_page = response.headers['Link'].split(';')[0].strip('<>')
+    response = client.get(next_page)
+    assert [c['days_overdue'] for c in response.get_json()] == [2]
+    assert 'Link' not in response.headers
+
+def test_sweep_overdue_command(app, client):
+    """Test the sweep-overdue CLI command."""
+    add_overdue(days=2)
+    result = app.test_cli_runner().invoke(args=['library', 'sweep-overdue'])
+    assert 'Flagged 1 overdue checkout(s).' in result.output
+    result = app.test_cli_runner().invoke(args=['library', 'sweep-overdue'])
+    assert 'Flagged 0 overdue checkout(s).' in result.output
+
+def test_sweeper_is_opt_in_and_never_runs_in_commands():
+    """Test the background sweeper is off by default and not started by `flask` commands."""
+    assert 'overdue_sweeper' not in create_app({}).extensions
+    with click.Context(click.Command('upgrade')):
+        app = create_app({'OVERDUE_SWEEP_INTERVAL': 60})
+    assert 'overdue_sweeper' not in app.extensions
+
+def test_batch_checkouts_and_returns(client, assert_max_queries):
+    """Test processing a whole drop box in one request and a few queries."""
+    due_date = (datetime.utcnow() + timedelta(days=14)).isoformat() + 'Z'
+    books = [Book(title=f'Batch {i}', author='A', isbn=f'{6000000000 + i}',
+                  total_copies=1, available_copies=0) for i in range(50)]
+    db.session.add_all(books)
+    db.session.flush()
+    checkouts = [Checkout(book_id=b.id, user_id=7, due_date=datetime.utcnow())
+                 for b in books]
+    db.session.add_all(checkouts)
+    db.session.commit()
+    checkout_ids = [c.id for c in checkouts]
+    book_ids = [b.id for b in books]
+    db.session.expunge_all()
+
+    batch = {
+        'returns': checkout_ids + [999],
+        'checkouts': [
+            {'book_id': 1, 'user_id': 1, 'due_date': due_date},
+            {'book_id': 1, 'user_id': 1, 'due_date': due_date},
+            {'book_id': 404, 'user_id': 1, 'due_date': due_date},
+            {'book_id': 1},
+            {'book_id': book_ids[0], 'user_id': 8, 'due_date': due_date},
+        ],
+    }
+    # Plus one upsert per statistics table, however large the batch
+    with assert_max_queries(10):
+        response = client.post('/api/library/batch', json=batch)
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert [r['status'] for r in data['returns']] == ['ok'] * 50 + ['error']
+    statuses = [(r['status'], r.get('error')) for r in data['checkouts']]
+    assert statuses == [
+        ('ok', None),
+        ('error', 'You already have this book checked out'),
+        ('error', 'Book not found'),
+        ('error', 'Invalid data'),
+        ('ok', None),
+    ]
+    assert Checkout.query.filter(Checkout.return_date.is_(None)).count() == 2
+    assert Book.query.get(1).available_copies == 1
+    assert db.session.get(Book, book_ids[0]).available_copies == 0
+    assert db.session.get(Book, book_ids[1]).available_copies == 1
+
+def test_batch_rejects_malformed_ids(client):
+    """Test non-integer return ids and item types are rejected with 400, not a 500."""
+    for body in ({'returns': [{}]}, {'returns': ['1']}, {'returns': [True]},
+                 {'checkouts': [[1]], 'returns': [[]]}, [1, 2]):
+        assert client.post('/api/library/batch', json=body).status_code == 400
+    response = client.post('/api/library/batch', json={'checkouts': [{'book_id': {}}]})
+    assert response.status_code == 200
+    assert response.get_json()['checkouts'][0]['error'] == 'Invalid data'
+
+def test_stats_follow_checkouts_and_returns(client):
+    """Test the statistics endpoint tracks checkouts and returns."""
+    db.session.add_all(User(name=f'Reader {i}', email=f'reader{i}@example.com', password='x')
+                       for i in (1, 2))
+    db.session.commit()
+    due_date = (datetime.utcnow() + timedelta(days=14)).isoformat() + 'Z'
+    client.post('/api/library/checkout', json={'book_id': 1, 'user_id': 1, 'due_date': due_date})
+    response = client.post('/api/library/checkout',
+                           json={'book_id': 1, 'user_id': 2, 'due_date': due_date})
+    client.post(f"/api/library/return/{response.get_json()['checkout_id']}")
+
+    response = client.get('/api/library/stats?book_id=1&user_id=2')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['total_loans'] == 2
+    assert data['active_loans'] == 1
+    assert data['most_borrowed'] == [{
+        'book_id': 1, 'title': 'Test Book', 'loans': 2, 'active_loans': 1,
+        'total_copies': 2, 'utilization': 0.5,
+    }]
+    assert [u['user_id'] for u in data['top_borrowers']] == [2, 1]
+    assert data['book']['loans'] == 2
+    assert data['user'] == {'user_id': 2, 'name': 'Reader 2', 'loans': 1, 'active_loans': 0}
+
+def test_deleting_a_book_removes_its_loans_from_stats(client):
+    """Test deleting a book takes its checkouts out of the statistics."""
+    db.session.add_all(User(name=f'Reader {i}', email=f'reader{i}@example.com', password='x')
+                       for i in (1, 2))
+    db.session.add(Book(title='Kept', author='Author', isbn='9780000000011',
+                        total_copies=1, available_copies=1))
+    db.session.commit()
+    due_date = (datetime.utcnow() + timedelta(days=14)).isoformat() + 'Z'
+    for book_id, user_id in ((1, 1), (1, 2), (2, 1)):
+        response = client.post('/api/library/checkout', json={
+            'book_id': book_id, 'user_id': user_id, 'due_date': due_date})
+        assert response.status_code == 200
+    assert client.get('/api/library/stats').get_json()['total_loans'] == 3
+
+    assert client.delete('/api/books/1').status_code == 204
+    data = client.get('/api/library/stats').get_json()
+    assert (data['total_loans'], data['active_loans']) == (1, 1)
+    assert [b['book_id'] for b in data['most_borrowed']] == [2]
+    assert [(u['user_id'], u['loans']) for u in data['top_borrowers']] == [(1, 1), (2, 0)]
+
+def test_rebuild_stats_command(app, client):
+    """Test rebuilding statistics from checkouts added behind their back."""
+    add_overdue(days=2)
+    assert client.get('/api/library/stats').get_json()['total_loans'] == 0
+    result = app.test_cli_runner().invoke(args=['library', 'rebuild-stats'])
+    assert 'Circulation statistics rebuilt.' in result.output
+    data = client.get('/api/library/stats').get_json()
+    assert (data['total_loans'], data['active_loans']) == (1, 1)
+    assert data['most_borrowed'][0]['book_id'] == 1
+
+def test_concurrent_checkouts_never_oversell(tmp_path):
+    """Stress test: hundreds of concurrent checkouts of one title."""
+    from concurrent.futures import ThreadPoolExecutor
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "stress.db"}',
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(Book(title='Popular', author='A', isbn='7000000000',
+                            total_copies=25, available_copies=25))
+        db.session.commit()
+
+    due_date = (datetime.utcnow() + timedelta(days=14)).isoformat() + 'Z'
+    def checkout(user_id):
+        client = app.test_client()
+        response = client.post('/api/library/checkout', json={
+            'book_id': 1, 'user_id': user_id, 'due_date': due_date})
+        return response.status_code
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        statuses = list(pool.map(checkout, range(1, 301)))
+
+    # Every request is answered: no lock errors, exactly one success per copy
+    assert statuses.count(200) == 25
+    assert statuses.count(400) == 275
+
+    with app.app_context():
+        assert db.session.get(Book, 1).available_copies == 0
+        assert Checkout.query.count() == 25
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,69 @@
+import re
+import pytest
+from app import create_app, db
+from app.metrics import Histogram
+from app.models import Book
+
+@pytest.fixture
+def app():
+    app = create_app({'METRICS_SERVER_TIMING': True})
+    with app.app_context():
+        db.create_all()
+        db.session.add(Book(title='Measured', author='Author', isbn='9780000000002',
+                            total_copies=1, available_copies=1))
+        db.session.commit()
+    yield app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def sample(text, name, **labels):
+    """The value of one sample in Prometheus text, or None"""
+    wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf'^{name}\{{{re.escape(wanted)}\}} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else None
+
+def test_histogram_buckets_are_cumulative():
+    """Test histogram samples count every observation at or below each bound."""
+    histogram = Histogram((1, 5))
+    for value in (0, 1, 3, 9):
+        histogram.observe(value)
+    assert list(histogram.samples('q', 'a="b"')) == [
+        'q_bucket{a="b",le="1"} 2',
+        'q_bucket{a="b",le="5"} 3',
+        'q_bucket{a="b",le="+Inf"} 4',
+        'q_sum{a="b"} 13',
+        'q_count{a="b"} 4',
+    ]
+
+def test_metrics_count_requests_and_queries(client):
+    """Test per-endpoint status counts, latency and database queries."""
+    client.get('/api/books/1')
+    client.get('/api/books/1')
+    client.get('/api/books/99')
+    client.get('/no/such/page')
+
+    text = client.get('/metrics').get_data(as_text=True)
+    endpoint = {'method': 'GET', 'endpoint': 'books.get_book'}
+    assert sample(text, 'http_requests_total', **endpoint, status='200') == 2
+    assert sample(text, 'http_requests_total', **endpoint, status='404') == 1
+    assert sample(text, 'http_requests_total', method='GET', endpoint='unmatched',
+                  status='404') == 1
+    assert sample(text, 'http_request_duration_seconds_count', **endpoint) == 3
+    # The second read is a cache hit and costs no query
+    assert sample(text, 'http_request_db_queries_bucket', **endpoint, le='0') == 1
+    assert sample(text, 'http_request_db_queries_sum', **endpoint) == 2
+    assert sample(text, 'http_request_db_seconds_total', **endpoint) > 0
+
+def test_server_timing_header(client):
+    """Test the optional Server-Timing header reports database use."""
+    response = client.get('/api/books?search=measured')
+    assert re.fullmatch(r'app;dur=[\d.]+, db;dur=[\d.]+;desc="2 queries"',
+                        response.headers['Server-Timing'])
+
+def test_metrics_can_be_disabled():
+    """Test no hooks or endpoint are added when metrics are off."""
+    app = create_app({'METRICS_ENABLED': False})
+    assert 'metrics' not in app.extensions
+    assert app.test_client().get('/metrics').status_code == 404
@@ -0,0 +1,60 @@
+import logging
+import pytest
+from app import create_app, db
+from app.models import Book
+from app.profiling import RepeatedQueryError, profile_queries
+
+@pytest.fixture
+def app():
+    app = create_app({'QUERY_REPEAT_THRESHOLD': 3})
+
+    @app.route('/test/titles')
+    def titles():
+        # One query per book: the N+1 the profiler is there to catch
+        return {'titles': [db.session.get(Book, i).title for i in range(1, 6)]}
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(Book(title=f'Book {i}', author='Author', isbn=f'97800000001{i:02}',
+                                total_copies=1, available_copies=1) for i in range(5))
+        db.session.commit()
+    yield app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def test_repeated_query_fails_request(client):
+    """Test a request repeating a statement past the threshold raises in tests."""
+    with pytest.raises(RepeatedQueryError, match='likely an N\\+1 query'):
+        client.get('/test/titles')
+
+def test_repeated_query_warns(app, client, caplog):
+    """Test the warn action logs the statement once and lets the request finish."""
+    app.config['QUERY_REPEAT_ACTION'] = 'warn'
+    with caplog.at_level(logging.WARNING):
+        assert client.get('/test/titles').status_code == 200
+    warnings = [r for r in caplog.records if 'N+1' in r.getMessage()]
+    assert len(warnings) == 1
+    assert 'FROM books' in warnings[0].getMessage()
+
+def test_slow_query_logged_with_plan(app, caplog):
+    """Test slow queries are logged with their query plan."""
+    logger = logging.getLogger('test.profiling')
+    with app.app_context(), caplog.at_level(logging.WARNING, logger='test.profiling'):
+        with profile_queries(logger, repeat_threshold=10, slow_ms=1e-6):
+            db.session.execute(db.select(Book).where(Book.isbn == '9780000000100')).all()
+    message = caplog.records[0].getMessage()
+    assert message.startswith('Slow query')
+    assert 'SEARCH books USING INDEX' in message
+
+def test_repeated_query_counted_by_assert_max_queries(app, client, assert_max_queries):
+    """Test the N+1 warned about is also caught by a test's query limit."""
+    app.config['QUERY_REPEAT_ACTION'] = 'warn'
+    with pytest.raises(AssertionError, match='5 queries issued, expected at most 1'):
+        with assert_max_queries(1):
+            client.get('/test/titles')
+    # A cached read costs nothing
+    client.get('/api/books/1')
+    with assert_max_queries(0):
+        client.get('/api/books/1')
@@ -0,0 +1,82 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import func, select
+from app import create_app, db
+from app.library.stats import rebuild_stats
+from app.models import Book, BookStats, Checkout, CirculationTotals, User, UserStats
+from app.seed import isbn13, seed_database
+
+NOW = datetime(2026, 1, 15, 12, 0)
+
+@pytest.fixture
+def app():
+    app = create_app({})
+    with app.app_context():
+        db.create_all()
+    yield app
+
+def snapshot():
+    return (db.session.execute(select(Book.isbn, Book.title, Book.author, Book.date_added)
+                               .order_by(Book.id)).all(),
+            db.session.execute(select(Checkout.book_id, Checkout.user_id, Checkout.due_date,
+                                      Checkout.return_date).order_by(Checkout.id)).all())
+
+def rollups():
+    return [db.session.execute(select(*model.__table__.columns)
+                               .order_by(*model.__table__.primary_key)).all()
+            for model in (BookStats, UserStats, CirculationTotals)]
+
+def test_isbn13_check_digits():
+    """Test generated ISBNs carry a valid ISBN-13 check digit."""
+    assert isbn13(0) == '9780000000002'
+    assert isbn13(30640615) == '9780306406157'
+    for number in (1, 999, 123456789, 999999999):
+        digits = isbn13(number)
+        assert sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10 == 0
+
+def test_seed_is_deterministic(app):
+    """Test the same seed produces the same rows."""
+    with app.app_context():
+        seed_database(books=200, users=20, checkouts=500, seed=7, now=NOW)
+        first = snapshot()
+        db.drop_all()
+        db.create_all()
+        seed_database(books=200, users=20, checkouts=500, seed=7, now=NOW)
+        assert snapshot() == first
+        assert first[0][0].date_added.year == 2023
+
+def test_seeded_data_is_consistent(app):
+    """Test copies, overdue flags and statistics agree with the checkouts."""
+    with app.app_context():
+        counts = seed_database(books=300, users=30, checkouts=2000, seed=1, now=NOW)
+        assert counts == {'users': 30, 'books': 300, 'checkouts': 2000}
+
+        open_loans = dict(db.session.execute(
+            select(Checkout.book_id, func.count()).where(Checkout.return_date.is_(None))
+            .group_by(Checkout.book_id)).all())
+        for book in Book.query:
+            assert book.available_copies == book.total_copies - open_loans.get(book.id, 0)
+            assert book.available_copies >= 0
+
+        overdue = Checkout.query.filter(Checkout.overdue.is_(True)).all()
+        assert overdue and all(c.return_date is None and c.due_date < NOW for c in overdue)
+        assert Checkout.query.filter(Checkout.return_date.isnot(None)).count() > 1000
+        assert db.session.scalar(select(func.sum(BookStats.loans))) == 2000
+        assert db.session.get(User, 1).is_admin
+
+        seeded = rollups()
+        rebuild_stats()
+        assert rollups() == seeded
+
+def test_seed_command(app):
+    """Test the CLI seeds an empty database and refuses a full one."""
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['seed', '--books', '50', '--users', '5', '--checkouts', '100'])
+    assert result.exit_code == 0, result.output
+    assert '5 users, 50 books, 100 checkouts' in result.output
+    with app.app_context():
+        assert app.test_client().get('/api/books?search=the').get_json()['total'] == 50
+
+    result = runner.invoke(args=['seed', '--books', '50'])
+    assert result.exit_code != 0
+    assert 'users is not empty' in result.output